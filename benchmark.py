@@ -0,0 +1,99 @@
+import random
+import time
+
+import numpy as np
+
+import population
+import population_2
+from evaluation import FitnessEvaluator
+from fitness_cache import FitnessCache
+from stopping import StoppingRules
+
+BENCHMARK_METHODS = ('ga', 'cmaes', 'de', 'snp_cmaes', 'snp_de')
+_POPULATIONS = {
+    1: (population.generate_configs_1, population.genetic_algorithm_optimized_1,
+        population.optimize_traits_1, population.optimize_snp_effects_1),
+    2: (population_2.generate_configs_2, population_2.genetic_algorithm_optimized_2,
+        population_2.optimize_traits_2, population_2.optimize_snp_effects_2),
+}
+
+
+def _run_method(method, population_id, configs, evaluator, stopping, seed):
+    generate, ga, optimize_traits, optimize_snp = _POPULATIONS[population_id]
+    stats = {}
+    if method == 'ga':
+        _, fitness_history, *_ = ga(configs, evaluator, stats, stopping=stopping)
+        best = max(fitness_history)
+    elif method in ('cmaes', 'de'):
+        _, best, _ = optimize_traits(method, evaluator, stopping, stats, seed)
+    else:
+        _, fitness_history = optimize_snp(configs, method[len('snp_'):], evaluator, stopping, stats, seed)
+        best = max(fitness_history)
+    return best, stats
+
+
+#Сравнение оптимизаторов по числу моделирований до урожая target на наборах population (1 - Plant_1,
+#2 - Plant_2). Каждый запуск получает свой пустой кэш и не использует хранилище, иначе счетчик
+#моделирований зависел бы от предыдущих запусков. В повторе r все методы видят одни и те же конфигурации.
+#Возвращает список записей по запускам.
+def benchmark(target, populations=(1, 2), methods=BENCHMARK_METHODS, repeats=3, max_evaluations=3000, seed=0,
+              mode='serial', workers=None):
+    records = []
+    for population_id in populations:
+        generate = _POPULATIONS[population_id][0]
+        for repeat in range(repeats):
+            random.seed(seed + repeat)
+            np.random.seed(seed + repeat)
+            configs = generate()
+            for method in methods:
+                random.seed(seed + repeat)
+                np.random.seed(seed + repeat)
+                stopping = StoppingRules(target=target, max_evaluations=max_evaluations)
+                with FitnessEvaluator(mode, workers, cache=FitnessCache(), store=False) as evaluator:
+                    started = time.perf_counter()
+                    best, stats = _run_method(method, population_id, configs, evaluator, stopping, seed + repeat)
+                records.append({
+                    'population': population_id,
+                    'method': method,
+                    'repeat': repeat,
+                    'reached': stats['stop_reason'] == 'target',
+                    'simulations': stats['simulations'],
+                    'generations': stats['generations'],
+                    'best': float(best),
+                    'seconds': time.perf_counter() - started,
+                })
+    return records
+
+
+#Итог по (набор, метод): доля успешных запусков, медиана моделирований до цели среди успешных, средний лучший урожай
+def summarize(records):
+    summary = []
+    keys = list(dict.fromkeys((r['population'], r['method']) for r in records))
+    for population_id, method in keys:
+        runs = [r for r in records if r['population'] == population_id and r['method'] == method]
+        reached = [r['simulations'] for r in runs if r['reached']]
+        summary.append({
+            'population': population_id,
+            'method': method,
+            'success_rate': len(reached) / len(runs),
+            'median_simulations_to_target': float(np.median(reached)) if reached else float('nan'),
+            'mean_best': float(np.mean([r['best'] for r in runs])),
+            'mean_seconds': float(np.mean([r['seconds'] for r in runs])),
+        })
+    return summary
+
+
+def format_summary(summary, target):
+    lines = [f"target yield {target}",
+             "{:<4} {:<10} {:>8} {:>14} {:>10} {:>8}".format('pop', 'method', 'success', 'sims to target',
+                                                              'mean best', 'sec')]
+    for row in summary:
+        lines.append("{:<4} {:<10} {:>8.2f} {:>14.0f} {:>10.3f} {:>8.1f}".format(
+            row['population'], row['method'], row['success_rate'], row['median_simulations_to_target'],
+            row['mean_best'], row['mean_seconds']))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    target = 27.4
+    print(format_summary(summarize(benchmark(target)), target))
@@ -0,0 +1,218 @@
+import csv
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from evaluation import make_config
+from fitness_cache import fitness_fingerprint
+from model import apply_parameter_overrides, calculate_yield_batch, get_forcing, get_parameter, model_parameters
+from settings import DAYS, FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION, SEED_MASS, temperatures
+
+OBSERVABLES = ('height', 'leaves', 'buds', 'biomass', 'yield')
+
+
+#Наблюдаемые траектории из CSV: столбец day и любые из OBSERVABLES, пустая ячейка - нет наблюдения.
+#Возвращает {переменная: (дни, значения)}.
+def load_observations(path):
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f)
+        columns = [c for c in reader.fieldnames if c != 'day']
+        unknown = [c for c in columns if c not in OBSERVABLES]
+        if 'day' not in reader.fieldnames or unknown:
+            raise ValueError(f"{path}: expected a 'day' column and columns from {OBSERVABLES}, got {reader.fieldnames}")
+        rows = list(reader)
+
+    observations = {}
+    for column in columns:
+        points = [(int(row['day']), float(row[column])) for row in rows if row[column].strip()]
+        if points:
+            days, values = zip(*points)
+            observations[column] = (np.array(days), np.array(values))
+    return observations
+
+
+#Потери каждой реплики: сумма по переменным среднего квадрата отклонения от наблюдений,
+#нормированного на разброс наблюдений (или на их средний квадрат, если разброса нет)
+def trajectory_losses(history, observations, weights=None):
+    losses = 0.0
+    for name, (days, values) in observations.items():
+        simulated = history[name][days - 1]
+        scale = np.var(values) or np.mean(values ** 2) or 1.0
+        weight = weights.get(name, 1.0) if weights else 1.0
+        losses = losses + weight * np.mean((simulated - values[:, np.newaxis]) ** 2, axis=0) / scale
+    return losses
+
+
+#Недопустимый набор констант (например, невозрастающие пороги стадий) получает бесконечные потери
+def _replicate_losses(config, overrides, replicates):
+    try:
+        parameters = apply_parameter_overrides(overrides)
+    except ValueError:
+        return np.full(len(replicates), np.inf)
+    with model_parameters(parameters=parameters):
+        _, _, history = calculate_yield_batch(
+            days=config['days'],
+            grain_params=(FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION),
+            initial_biomass=SEED_MASS,
+            traits_matrix=np.tile(config['traits'], (len(replicates), 1)),
+            rngs=[np.random.default_rng(np.random.SeedSequence(config['base_seed'], spawn_key=(rep,)))
+                  for rep in replicates],
+            forcing=get_forcing(config['latitude'], config['temperatures'], config['days']),
+            return_history=True
+        )
+    return trajectory_losses(history, config['observations'], config['weights'])
+
+
+#Отпечаток всего, от чего зависят потери: наблюдения, веса, признаки растения, seed,
+#число реплик, константы settings и условия сезона
+def calibration_fingerprint(config, replicates):
+    observations = sorted((name, days.tolist(), values.tolist()) for name, (days, values) in config['observations'].items())
+    weights = sorted(config['weights'].items()) if config['weights'] else None
+    key = (observations, weights, [float(t) for t in config['traits']], replicates, fitness_fingerprint(config))
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+#Состояние калибровки, которое переживает перезапуск: пишется в JSON после каждой итерации
+class CalibrationState:
+    def __init__(self, names, low, high, center, center_losses, step, iteration=0, evaluations=0, runs=0,
+                 rejected=0, seconds=0.0, history=None, fingerprint=None):
+        self.names = list(names)
+        self.low = np.asarray(low, dtype=float)
+        self.high = np.asarray(high, dtype=float)
+        self.center = np.asarray(center, dtype=float)
+        self.center_losses = np.asarray(center_losses, dtype=float)
+        self.step = step
+        self.iteration = iteration
+        self.evaluations = evaluations
+        self.runs = runs
+        self.rejected = rejected
+        self.seconds = seconds
+        self.history = history if history is not None else []
+        self.fingerprint = fingerprint
+
+    @property
+    def loss(self):
+        return float(self.center_losses.mean())
+
+    def parameters(self, unit=None):
+        unit = self.center if unit is None else unit
+        return dict(zip(self.names, (self.low + unit * (self.high - self.low)).tolist()))
+
+    def save(self, path):
+        state = {key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in vars(self).items()}
+        with open(str(path) + '.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(str(path) + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(**json.load(f))
+
+
+#Калибровка констант модели по наблюдениям: обобщенный поиск по образцу в нормированном ящике параметров.
+#parameters - список (имя, нижняя граница, верхняя граница) с именами из model.apply_parameter_overrides.
+#Каждая итерация опрашивает 2k точек center +- step по осям. Точка сначала считается на screen_replicates
+#репликах и отбрасывается, если на тех же репликах (общие случайные числа) хуже центра больше чем
+#на reject_margin; выжившие досчитываются на всех replicates. Нет улучшения - шаг делится пополам.
+#Недопустимые наборы констант отбрасываются, как плохие точки.
+#checkpoint - путь к JSON, по которому прерванная калибровка продолжается с последней итерации.
+def calibrate(observations, parameters, traits, replicates=8, screen_replicates=2, reject_margin=0.1,
+              initial_step=0.25, min_step=1e-3, max_iterations=100, max_evaluations=None, workers=1,
+              checkpoint=None, seed=0, weights=None, days=DAYS, temperatures=temperatures, latitude=55.7,
+              verbose=False):
+    if isinstance(observations, (str, os.PathLike)):
+        observations = load_observations(observations)
+    observations = {name: (np.asarray(d, dtype=int), np.asarray(v, dtype=float)) for name, (d, v) in observations.items()}
+    if any(d.min() < 1 or d.max() > days for d, _ in observations.values()):
+        raise ValueError(f"observation days must lie within 1..{days}")
+
+    config = make_config(days, temperatures, latitude, base_seed=seed)
+    config.update(traits=list(traits), observations=observations, weights=weights)
+    names = [p[0] for p in parameters]
+    low = np.array([p[1] for p in parameters], dtype=float)
+    high = np.array([p[2] for p in parameters], dtype=float)
+    for name in names:
+        get_parameter(name)
+    fingerprint = calibration_fingerprint(config, replicates)
+    screen = list(range(min(screen_replicates, replicates)))
+    rest = list(range(len(screen), replicates))
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def run(units, reps):
+        tasks = [(config, dict(zip(names, (low + u * (high - low)).tolist())), reps) for u in units]
+        if executor is None:
+            return [_replicate_losses(*task) for task in tasks]
+        return list(executor.map(_replicate_losses, *zip(*tasks)))
+
+    try:
+        if checkpoint is not None and os.path.exists(checkpoint):
+            state = CalibrationState.load(checkpoint)
+            if (state.names != names or not np.allclose(state.low, low) or not np.allclose(state.high, high)
+                    or len(state.center_losses) != replicates):
+                raise ValueError(f"checkpoint {checkpoint} belongs to a different set of parameters")
+            if state.fingerprint != fingerprint:
+                raise ValueError(f"checkpoint {checkpoint} was written for different observations, traits, "
+                                 f"seed or model settings")
+        else:
+            start = np.clip([(get_parameter(n) - lo) / (hi - lo) for n, lo, hi in zip(names, low, high)], 0, 1)
+            started = time.perf_counter()
+            center_losses = run([start], screen + rest)[0]
+            state = CalibrationState(names, low, high, start, center_losses, initial_step, evaluations=1,
+                                     runs=replicates, seconds=time.perf_counter() - started,
+                                     fingerprint=fingerprint)
+
+        while (state.step >= min_step and state.iteration < max_iterations
+               and (max_evaluations is None or state.evaluations < max_evaluations)):
+            started = time.perf_counter()
+            k = len(names)
+            poll = [np.clip(state.center + sign * state.step * np.eye(k)[i], 0, 1)
+                    for i in range(k) for sign in (1, -1)]
+            poll = [u for u in poll if not np.allclose(u, state.center)]
+
+            screened = run(poll, screen)
+            threshold = state.center_losses[screen].mean() * (1 + reject_margin)
+            survivors = [i for i, losses in enumerate(screened) if np.isfinite(losses).all() and losses.mean() <= threshold]
+            full = run([poll[i] for i in survivors], rest) if rest else [np.zeros(0)] * len(survivors)
+
+            state.evaluations += len(poll)
+            state.runs += len(poll) * len(screen) + len(survivors) * len(rest)
+            state.rejected += len(poll) - len(survivors)
+            candidates = [np.concatenate([screened[i], losses]) for i, losses in zip(survivors, full)]
+            best = min(range(len(candidates)), key=lambda j: candidates[j].mean(), default=None)
+            if best is not None and candidates[best].mean() < state.loss:
+                state.center = poll[survivors[best]]
+                state.center_losses = candidates[best]
+            else:
+                state.step /= 2
+
+            state.iteration += 1
+            state.seconds += time.perf_counter() - started
+            state.history.append({'iteration': state.iteration, 'loss': state.loss, 'step': state.step,
+                                  'evaluations': state.evaluations})
+            if checkpoint is not None:
+                state.save(checkpoint)
+            if verbose:
+                print(f"iteration {state.iteration}: loss {state.loss:.5f}, step {state.step:.4f}, "
+                      f"{state.evaluations / state.seconds:.1f} evaluations/s")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return {
+        'parameters': state.parameters(),
+        'loss': state.loss,
+        'iterations': state.iteration,
+        'evaluations': state.evaluations,
+        'rejected': state.rejected,
+        'runs': state.runs,
+        'seconds': state.seconds,
+        'evaluations_per_second': state.evaluations / state.seconds if state.seconds > 0 else float('inf'),
+        'runs_per_second': state.runs / state.seconds if state.seconds > 0 else float('inf'),
+        'history': state.history,
+    }
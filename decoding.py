@@ -0,0 +1,312 @@
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+
+#Прежнее правило Plant_1._max_value: верхняя граница сырого значения по имени преобразования
+def default_max_raw(conf) -> float:
+    func_str = str(conf.transform).lower()
+    if 'sum' in func_str:
+        return 2 * len(conf.snp_indices)
+    elif 'prod' in func_str:
+        return len(conf.snp_indices) ** 3
+    elif 'max' in func_str:
+        return 2
+    elif 'len' in func_str or 'count' in func_str:
+        return len(conf.snp_indices)
+
+    return 2
+
+
+#Кодировка генотипа: bits_per_locus битов на локус читаются как двоичное число,
+#значения выше max_value сводятся к max_value.
+#diploid: 2*b0 + b1, 3 -> 2; haploid: один бит; многоаллельные - больше битов и max_value.
+class AlleleEncoding:
+    def __init__(self, name, bits_per_locus, max_value):
+        self.name = name
+        self.bits_per_locus = bits_per_locus
+        self.max_value = max_value
+
+    def __repr__(self):
+        return f"AlleleEncoding({self.name!r}, {self.bits_per_locus}, {self.max_value})"
+
+    def _combine(self, bits):
+        values = bits[..., 0].astype(np.int8)
+        for b in range(1, self.bits_per_locus):
+            values = values * 2 + bits[..., b]
+        np.minimum(values, self.max_value, out=values)
+        return values
+
+    #Значения SNP для матрицы геномов (особи x биты); loci - только эти локусы
+    def values(self, genomes, loci=None):
+        genomes = np.atleast_2d(np.asarray(genomes))
+        k = self.bits_per_locus
+        if loci is None:
+            bits = genomes.reshape(genomes.shape[0], -1, k)
+        else:
+            bits = genomes[:, k * np.asarray(loci)[:, None] + np.arange(k)]
+        return self._combine(bits)
+
+    #Значения SNP только в точках (строка, локус)
+    def values_at(self, genomes, rows, loci):
+        k = self.bits_per_locus
+        bits = genomes[np.asarray(rows)[:, None], k * np.asarray(loci)[:, None] + np.arange(k)]
+        return self._combine(bits)
+
+    #Обратное к values: биты генотипа (..., bits_per_locus) для значений SNP, старший бит первым
+    def encode(self, values):
+        values = np.minimum(np.asarray(values, dtype=np.int64), self.max_value)
+        shifts = np.arange(self.bits_per_locus - 1, -1, -1)
+        return ((values[..., np.newaxis] >> shifts) & 1).astype(np.uint8)
+
+
+DIPLOID = AlleleEncoding('diploid', 2, 2)
+HAPLOID = AlleleEncoding('haploid', 1, 1)
+ENCODINGS = {encoding.name: encoding for encoding in (DIPLOID, HAPLOID)}
+
+
+def get_encoding(encoding) -> AlleleEncoding:
+    if isinstance(encoding, AlleleEncoding):
+        return encoding
+    if encoding not in ENCODINGS:
+        raise ValueError(f"encoding must be one of {tuple(ENCODINGS)} or an AlleleEncoding, got {encoding!r}")
+    return ENCODINGS[encoding]
+
+
+def snp_values(genomes, encoding='diploid', loci=None):
+    return get_encoding(encoding).values(genomes, loci)
+
+
+def snp_values_at(genomes, rows, loci, encoding='diploid'):
+    return get_encoding(encoding).values_at(genomes, rows, loci)
+
+
+#Наибольшее значение SNP в кодировке
+def max_snp_value(encoding='diploid') -> int:
+    return get_encoding(encoding).max_value
+
+
+#Границы сырого значения взвешенной суммы: каждый SNP берет 0 или max_snp, что дает меньший/больший вклад
+def linear_raw_range(weights, max_snp):
+    contributions = np.asarray(weights, dtype=float) * max_snp
+    return float(np.minimum(contributions, 0).sum()), float(np.maximum(contributions, 0).sum())
+
+
+#Преобразование взвешенной суммы для построчного пути (conf.transform).
+#Класс, а не замыкание, чтобы конфигурации передавались в процессы-воркеры.
+class WeightedSum:
+    def __init__(self, weights):
+        self.weights = np.asarray(weights, dtype=float)
+
+    def __call__(self, snps):
+        return float(np.dot(snps, self.weights))
+
+
+#Описание одного признака: локусы SNP, преобразование их значений и диапазон признака.
+#min_raw/max_raw - границы сырого значения, weights - эффекты локусов для линейных признаков.
+class ParameterConfig:
+    def __init__(self, snp_indices: List[int],
+                 transform: Callable[[List[int]], float],
+                 value_range: Tuple[float, float],
+                 min_raw: float = None,
+                 max_raw: float = None,
+                 weights: np.ndarray = None):
+        self.snp_indices = snp_indices
+        self.transform = transform
+        self.value_range = value_range
+        self.min_raw = min_raw
+        self.max_raw = max_raw
+        self.weights = weights
+
+
+#Конфигурации для больших панелей SNP (10^4-10^6 локусов) кодировки encoding, по одной на диапазон ranges:
+#у каждого признака разреженный вектор из effects_per_trait эффектов, доля pleiotropy эффектов
+#приходится на локусы, общие для всех признаков.
+def generate_panel_configs(encoding, ranges, n_loci: int, effects_per_trait: int = 100, pleiotropy: float = 0.0,
+                           rng=None) -> List[ParameterConfig]:
+
+    rng = rng if rng is not None else np.random
+    n_shared = int(round(effects_per_trait * pleiotropy))
+    shared = rng.choice(n_loci, n_shared, replace=False)
+    configs = []
+
+    for value_range in ranges:
+        own = rng.choice(n_loci, effects_per_trait - n_shared, replace=False)
+        snp_indices = np.union1d(shared, own)
+        weights = rng.standard_normal(len(snp_indices))
+        min_raw, max_raw = linear_raw_range(weights, max_snp_value(encoding))
+
+        configs.append(ParameterConfig(
+            snp_indices=snp_indices,
+            transform=WeightedSum(weights),
+            value_range=value_range,
+            min_raw=min_raw,
+            max_raw=max_raw,
+            weights=weights
+        ))
+
+    return configs
+
+
+#Список ParameterConfig, собранный один раз в разреженные массивы эффектов.
+#Для линейных признаков (веса или среднее) хранятся только ненулевые эффекты: по признакам (CSR)
+#для декодирования и по локусам (CSC) для пересчета потомков, поэтому память и время растут
+#с числом эффектов, а не с длиной генома x числом признаков. Локус может влиять на несколько признаков.
+#Медианы считаются по столбцам, произвольные преобразования - построчно через conf.transform.
+class CompiledDecoder:
+    def __init__(self, configs, encoding='diploid'):
+        self.encoding = get_encoding(encoding)
+        self.configs = list(configs)
+        n_traits = len(self.configs)
+
+        trait_loci = [np.asarray(conf.snp_indices, dtype=np.int64) for conf in self.configs]
+        self.loci = np.unique(np.concatenate(trait_loci))
+
+        self.scale = np.ones(n_traits)
+        self.linear = np.zeros(n_traits, dtype=bool)
+        self.median_columns = {}
+        self.custom = []
+
+        self.raw_low = np.zeros(n_traits)
+        self.raw_high = np.zeros(n_traits)
+        self.value_low = np.zeros(n_traits)
+        self.value_high = np.zeros(n_traits)
+
+        effect_traits, effect_positions, effect_weights = [], [], []
+        for j, conf in enumerate(self.configs):
+            columns = np.searchsorted(self.loci, trait_loci[j])
+            weights = getattr(conf, 'weights', None)
+            if weights is not None:
+                weights = np.asarray(weights, dtype=float)
+                self.linear[j] = True
+            elif conf.transform is np.mean:
+                # Сумма целых значений SNP точна, деление на n выполняется отдельно
+                weights = np.ones(len(columns))
+                self.scale[j] = 1.0 / len(columns)
+                self.linear[j] = True
+            elif conf.transform is np.median:
+                self.median_columns[j] = columns
+            else:
+                self.custom.append((j, columns, conf.transform))
+
+            if self.linear[j]:
+                effect_traits.append(np.full(len(columns), j, dtype=np.int64))
+                effect_positions.append(columns)
+                effect_weights.append(weights)
+
+            if conf.min_raw is not None and conf.max_raw is not None:
+                self.raw_low[j], self.raw_high[j] = conf.min_raw, conf.max_raw
+            else:
+                self.raw_low[j], self.raw_high[j] = 0, default_max_raw(conf)
+            self.value_low[j], self.value_high[j] = conf.value_range
+
+        self.linear_columns = np.flatnonzero(self.linear)
+        self._compile_effects(effect_traits, effect_positions, effect_weights)
+
+    def _compile_effects(self, traits, positions, weights):
+        n_traits = len(self.configs)
+        n_positions = len(self.loci)
+        if traits:
+            traits = np.concatenate(traits)
+            positions = np.concatenate(positions)
+            weights = np.concatenate(weights)
+        else:
+            traits = positions = np.zeros(0, dtype=np.int64)
+            weights = np.zeros(0)
+
+        # Повторы (признак, локус) складываются; порядок кодов дает CSR по признакам
+        codes, inverse = np.unique(traits * n_positions + positions, return_inverse=True)
+        self.effect_weights = np.bincount(inverse.ravel(), weights=weights, minlength=len(codes))
+        self.effect_traits = codes // n_positions
+        self.effect_positions = codes % n_positions
+        self.trait_ptr = np.searchsorted(self.effect_traits, np.arange(n_traits + 1))
+
+        by_locus = np.lexsort((self.effect_traits, self.effect_positions))
+        self.locus_traits = self.effect_traits[by_locus]
+        self.locus_weights = self.effect_weights[by_locus] * self.scale[self.locus_traits]
+        self.locus_ptr = np.searchsorted(self.effect_positions[by_locus], np.arange(n_positions + 1))
+
+    @property
+    def n_effects(self):
+        return len(self.effect_weights)
+
+    #Наименьшая длина генома (в локусах), покрывающая все используемые локусы
+    @property
+    def n_loci(self):
+        return int(self.loci[-1]) + 1 if len(self.loci) else 0
+
+    def locus_values(self, genomes):
+        return self.encoding.values(genomes, self.loci)
+
+    def raw_scores(self, genomes):
+        return self.scores_from_values(self.locus_values(genomes))
+
+    #Сырые оценки по матрице значений SNP (особи x self.loci)
+    def scores_from_values(self, values):
+        values = np.atleast_2d(values)
+        raw = np.zeros((values.shape[0], len(self.configs)))
+        for j in self.linear_columns:
+            start, end = self.trait_ptr[j], self.trait_ptr[j + 1]
+            raw[:, j] = (values[:, self.effect_positions[start:end]] @ self.effect_weights[start:end]) * self.scale[j]
+        for j, columns in self.median_columns.items():
+            raw[:, j] = np.median(values[:, columns], axis=1)
+        for j, columns, transform in self.custom:
+            raw[:, j] = [transform(list(row)) for row in values[:, columns]]
+        return raw
+
+    #Сырые оценки потомков из сырых оценок родителей: для линейных признаков прибавляется
+    #sum(w_i * dsnp_i) только по изменившимся локусам, медианы и прочие преобразования
+    #пересчитываются лишь у потомков, в которых что-то изменилось.
+    def rescore(self, parent_raw, parents, children):
+        if children.parents is None or children.changed is None:
+            return self.raw_scores(children.genomes)
+        rows, loci = children.changed
+        # Когда изменений больше, чем декодируемых локусов, полное разреженное декодирование дешевле
+        if len(rows) >= len(children) * len(self.loci):
+            return self.raw_scores(children.genomes)
+        source_rows = np.asarray(children.parents, dtype=np.intp)
+        raw = np.array(parent_raw, dtype=float)[source_rows]
+        rows = np.asarray(rows, dtype=np.intp)
+        loci = np.asarray(loci, dtype=np.intp)
+
+        positions = np.searchsorted(self.loci, loci)
+        used = positions < len(self.loci)
+        used[used] = self.loci[positions[used]] == loci[used]
+        rows, loci, positions = rows[used], loci[used], positions[used]
+
+        delta = (self.encoding.values_at(children.genomes, rows, loci).astype(np.int16)
+                 - self.encoding.values_at(parents.genomes, source_rows[rows], loci))
+        moved = delta != 0
+        rows, positions, delta = rows[moved], positions[moved], delta[moved]
+
+        if len(self.linear_columns) and len(rows):
+            # Каждое изменение разворачивается во все эффекты своего локуса (столбец CSC)
+            starts = self.locus_ptr[positions]
+            counts = self.locus_ptr[positions + 1] - starts
+            change = np.repeat(np.arange(len(rows)), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            effects = starts[change] + offsets
+            linear_delta = np.zeros_like(raw)
+            np.add.at(linear_delta, (rows[change], self.locus_traits[effects]),
+                      delta[change] * self.locus_weights[effects])
+            raw += linear_delta
+
+        if (self.median_columns or self.custom) and len(rows):
+            touched = np.unique(rows)
+            values = self.locus_values(children.genomes[touched])
+            for j, columns in self.median_columns.items():
+                raw[touched, j] = np.median(values[:, columns], axis=1)
+            for j, columns, transform in self.custom:
+                raw[touched, j] = [transform(list(row)) for row in values[:, columns]]
+        return raw
+
+    def traits_from_raw(self, raw):
+        raw = np.atleast_2d(raw)
+        traits = np.empty_like(raw, dtype=float)
+        for j in range(raw.shape[1]):
+            traits[:, j] = np.interp(raw[:, j], [self.raw_low[j], self.raw_high[j]],
+                                     [self.value_low[j], self.value_high[j]])
+        return np.round(traits, 2)
+
+    def decode(self, genomes):
+        return self.traits_from_raw(self.raw_scores(genomes))
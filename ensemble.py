@@ -0,0 +1,107 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from model import Simulation, calculate_yield_batch
+from settings import DAYS, FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION, SEED_MASS, temperatures
+
+
+#Каждая реплика получает собственный генератор из SeedSequence.spawn, поэтому ее результат
+#зависит только от seed и номера реплики, но не от числа процессов и разбиения на порции.
+#batched=True считает порцию через calculate_yield_batch и возвращает пары (yield, growth_time).
+def run_ensemble(traits, n_replicates, seed=None, workers=1, trace='summary', chunk_size=None,
+                 days=DAYS, temperatures=temperatures, latitude=55.7, batched=False):
+    seed_sequences = np.random.SeedSequence(seed).spawn(n_replicates)
+    config = {
+        'traits': tuple(traits),
+        'trace': trace,
+        'days': days,
+        'temperatures': list(temperatures),
+        'latitude': latitude,
+        'batched': batched,
+    }
+
+    if workers is None:
+        workers = _default_workers()
+    if chunk_size is None:
+        chunk_size = max(1, math.ceil(n_replicates / (workers * 4)))
+    chunks = [seed_sequences[i:i + chunk_size] for i in range(0, n_replicates, chunk_size)]
+
+    if workers <= 1 or len(chunks) <= 1:
+        chunk_results = [_run_chunk(config, chunk) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunk_results = list(executor.map(_run_chunk, [config] * len(chunks), chunks))
+
+    return [result for chunk in chunk_results for result in chunk]
+
+
+def _default_workers():
+    return os.cpu_count() or 1
+
+
+def _run_chunk(config, seed_sequences):
+    if config['batched']:
+        yields, growth_times = calculate_yield_batch(
+            days=config['days'],
+            grain_params=(FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION),
+            initial_biomass=SEED_MASS,
+            temperatures=config['temperatures'],
+            latitude=config['latitude'],
+            traits_matrix=np.tile(config['traits'], (len(seed_sequences), 1)),
+            rngs=[np.random.default_rng(seq) for seq in seed_sequences]
+        )
+        return list(zip(yields.tolist(), growth_times.tolist()))
+
+    # Префикс сезона до первой стохастической стадии общий для всех реплик порции
+    prefix = Simulation(
+        days=config['days'],
+        grain_params=(FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION),
+        initial_biomass=SEED_MASS,
+        traits=config['traits'],
+        temperatures=config['temperatures'],
+        latitude=config['latitude'],
+        trace=config['trace'],
+        rng=np.random.default_rng(0)
+    ).run_until(stage=2)
+
+    return [prefix.fork(rng=np.random.default_rng(seq)).run() for seq in seed_sequences]
+
+
+def ensemble_yields(results):
+    if not results:
+        return np.array([])
+    first = results[0]
+    if isinstance(first, dict):
+        return np.array([r['yield'] for r in results])
+    return np.array([r[0] for r in results])
+
+
+#Среднее и нормальный доверительный интервал по репликам
+def ensemble_statistics(values, confidence=0.95):
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    mean = float(values.mean()) if n else float('nan')
+    std = float(values.std(ddof=1)) if n > 1 else 0.0
+    z = math.sqrt(2) * _erfinv(confidence)
+    half_width = z * std / math.sqrt(n) if n else float('nan')
+    return {
+        'n': n,
+        'mean': mean,
+        'std': std,
+        'ci_low': mean - half_width,
+        'ci_high': mean + half_width,
+    }
+
+
+def _erfinv(y):
+    # Обращение math.erf методом Ньютона: достаточно для уровней доверия
+    x = 0.0
+    for _ in range(50):
+        step = (math.erf(x) - y) / (2 / math.sqrt(math.pi) * math.exp(-x * x))
+        x -= step
+        if abs(step) < 1e-12:
+            break
+    return x
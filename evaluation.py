@@ -0,0 +1,180 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from fitness_cache import fitness_fingerprint, shared_fitness_cache
+from fitness_store import default_fitness_store
+from model import active_parameters, calculate_yield, get_forcing, model_parameters
+from settings import (DAYS, FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION, SEED_MASS, FITNESS_SEED,
+                      temperatures)
+
+EXECUTOR_MODES = ('serial', 'thread', 'process')
+
+
+def trait_key(traits):
+    return tuple(map(float, traits))
+
+
+#Генератор фитнес-оценки выводится из самих признаков, поэтому приспособленность - детерминированная
+#функция признаков: она не зависит ни от порядка вычислений, ни от того, в каком процессе считалась.
+def trait_rng(traits, base_seed=FITNESS_SEED):
+    entropy = [base_seed] + [int(round(t * 100)) % 2 ** 32 for t in traits]
+    return np.random.default_rng(np.random.SeedSequence(entropy))
+
+
+def make_config(days=DAYS, temperatures=temperatures, latitude=55.7, base_seed=FITNESS_SEED):
+    return {
+        'days': days,
+        'temperatures': list(temperatures),
+        'latitude': latitude,
+        'base_seed': base_seed,
+    }
+
+
+#(урожай, время роста) для набора признаков
+def simulate_traits(traits, config=None):
+    if config is None:
+        config = _default_config
+    days = config['days']
+    return calculate_yield(
+        days=days,
+        grain_params=(FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION),
+        initial_biomass=SEED_MASS,
+        traits=traits,
+        forcing=get_forcing(config['latitude'], config['temperatures'], days),
+        trace='none',
+        rng=trait_rng(traits, config['base_seed'])
+    )
+
+
+def evaluate_traits(traits, config=None):
+    return simulate_traits(traits, config)[0]
+
+
+_default_config = make_config()
+_worker_config = None
+
+
+def _init_worker(config):
+    global _worker_config
+    _worker_config = config
+    get_forcing(config['latitude'], config['temperatures'], config['days'])
+
+
+#parameters - действующие константы родителя; процесс мог унаследовать другие, если пул создан внутри model_parameters
+def _simulate_in_worker(traits, parameters=None):
+    if parameters is None or parameters == active_parameters():
+        return simulate_traits(traits, _worker_config)
+    with model_parameters(parameters=parameters):
+        return simulate_traits(traits, _worker_config)
+
+
+#Оценка приспособленности наборами признаков: serial, пул потоков или пул процессов.
+#Конфигурация и погода передаются процессам один раз при запуске пула, задачи несут только признаки.
+#cache=None - общий кэш shared_fitness_cache(), cache=False - без кэша.
+#store=None - постоянное хранилище из settings.FITNESS_STORE_PATH (если задан), store=False - без хранилища.
+#Порядок поиска: кэш в памяти, затем хранилище на диске, и только потом моделирование.
+class FitnessEvaluator:
+    def __init__(self, mode='serial', workers=None, chunk_size=None, config=None, cache=None, store=None):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"mode must be one of {EXECUTOR_MODES}, got {mode!r}")
+        self.mode = mode
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.config = config if config is not None else make_config()
+        if cache is None:
+            cache = shared_fitness_cache()
+        self.cache = cache if cache is not False else None
+        if store is None:
+            store = default_fitness_store()
+        self.store = store if store is not False else None
+        self.evaluations = 0
+        self._executor = None
+
+    #Считается при каждом обращении: ключ зависит от констант, действующих в момент оценки (model_parameters)
+    @property
+    def fingerprint(self):
+        return fitness_fingerprint(self.config)
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.mode == 'thread':
+                self._executor = ThreadPoolExecutor(max_workers=self.workers)
+            elif self.mode == 'process':
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                     initargs=(self.config,))
+        return self._executor
+
+    def evaluate(self, trait_sets, use_cache=True):
+        keys = list(dict.fromkeys(trait_key(traits) for traits in trait_sets))
+        fingerprint = self.fingerprint
+        results = {}
+        if self.cache is not None and use_cache:
+            pending = []
+            for key in keys:
+                value = self.cache.get(self.cache.key(fingerprint, key))
+                if value is None:
+                    pending.append(key)
+                else:
+                    results[key] = value
+            keys = pending
+
+        if self.store is not None and keys:
+            stored = self.store.get_many(fingerprint, keys)
+            keys = [key for key in keys if key not in stored]
+        else:
+            stored = {}
+
+        computed = self._compute(keys)
+        if self.store is not None:
+            self.store.put_many(fingerprint, computed)
+
+        for source in (stored, computed):
+            for key, (yield_value, _) in source.items():
+                if self.cache is not None:
+                    self.cache.put(self.cache.key(fingerprint, key), yield_value)
+                results[key] = yield_value
+        return results
+
+    def _compute(self, keys):
+        if not keys:
+            return {}
+        self.evaluations += len(keys)
+
+        if self.mode == 'serial' or len(keys) == 1:
+            values = [simulate_traits(key, self.config) for key in keys]
+        elif self.mode == 'thread':
+            values = list(self._get_executor().map(simulate_traits, keys, [self.config] * len(keys)))
+        else:
+            executor = self._get_executor()
+            chunk_size = self.chunk_size
+            if chunk_size is None:
+                # workers=None - пул по числу процессоров, как у ProcessPoolExecutor
+                chunk_size = max(1, len(keys) // (4 * (self.workers or os.cpu_count() or 1)))
+            parameters = [active_parameters()] * len(keys)
+            values = list(executor.map(_simulate_in_worker, keys, parameters, chunksize=chunk_size))
+
+        return dict(zip(keys, values))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+_default_evaluator = None
+
+
+def default_evaluator() -> FitnessEvaluator:
+    global _default_evaluator
+    if _default_evaluator is None:
+        _default_evaluator = FitnessEvaluator()
+    return _default_evaluator
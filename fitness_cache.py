@@ -0,0 +1,112 @@
+import hashlib
+import sys
+from collections import OrderedDict
+
+import settings
+from model import MODEL_VERSION, active_parameters, weather_hash
+
+#Приблизительные накладные расходы OrderedDict на одну запись
+_ENTRY_OVERHEAD = 100
+
+
+def quantize_traits(traits, decimals=2):
+    return tuple(round(float(t), decimals) for t in traits)
+
+
+#Отпечаток всего, от чего зависит приспособленность, кроме признаков: версия модели, действующие константы
+#(включая переопределения model_parameters) и конфигурация оценки
+def fitness_fingerprint(config) -> str:
+    parameters = active_parameters()
+    model_constants = (
+        MODEL_VERSION, settings.DAYS, settings.S_O_VALUES, parameters['CONVERSION_FACTORS'],
+        parameters['PP_PARAMS'], parameters['STAGE_PARAMS'], parameters['GROWTH_STAGES_BD'],
+        settings.SEEDS_PER_CAPSULE, parameters['CRPAR'], settings.SEED_MASS, settings.FLOWERING_START_DAY,
+        settings.GRAIN_FILLING_DURATION, settings.CAPSULE_MASS, settings.SOLAR_CONSTANT,
+    )
+    evaluation = (config['days'], float(config['latitude']), weather_hash(config['temperatures']),
+                  config['base_seed'])
+    return hashlib.sha1(repr((model_constants, evaluation)).encode()).hexdigest()
+
+
+#LRU-кэш приспособленности с ограничением по числу записей и памяти.
+#Ключ - (отпечаток конфигурации, квантованный кортеж признаков), поэтому один кэш
+#можно разделять между запусками с разными настройками.
+class FitnessCache:
+    def __init__(self, maxsize=100_000, max_bytes=64 * 2 ** 20, decimals=2):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.decimals = decimals
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, fingerprint, traits):
+        return fingerprint, quantize_traits(traits, self.decimals)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if key in self._entries:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = value
+        self._bytes += self._entry_size(key, value)
+        self._evict()
+
+    def _entry_size(self, key, value):
+        _, traits = key
+        return (sys.getsizeof(key) + sys.getsizeof(traits) + sum(sys.getsizeof(t) for t in traits)
+                + sys.getsizeof(value) + _ENTRY_OVERHEAD)
+
+    def _evict(self):
+        while self._entries and (
+                (self.maxsize is not None and len(self._entries) > self.maxsize)
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            key, value = self._entries.popitem(last=False)
+            self._bytes -= self._entry_size(key, value)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hit_rate,
+        }
+
+
+_shared_cache = None
+
+
+def shared_fitness_cache() -> FitnessCache:
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = FitnessCache()
+    return _shared_cache
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+
+from fitness_cache import quantize_traits
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS fitness (
+    fingerprint TEXT NOT NULL,
+    traits TEXT NOT NULL,
+    yield REAL NOT NULL,
+    growth_time INTEGER NOT NULL,
+    PRIMARY KEY (fingerprint, traits)
+) WITHOUT ROWID
+'''
+_QUERY_CHUNK = 500
+
+
+#Постоянное хранилище (отпечаток настроек и погоды, признаки) -> (урожай, время роста) в SQLite.
+#Режим WAL и таймаут блокировки позволяют писать из нескольких процессов одновременно;
+#соединение открывается заново в каждом процессе, поэтому объект можно передавать в пул.
+class FitnessStore:
+    def __init__(self, path, timeout=30.0, decimals=2):
+        self.path = path
+        self.timeout = timeout
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        pid = os.getpid()
+        if self._connection is None or self._pid != pid:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(_SCHEMA)
+            self._connection = connection
+            self._pid = pid
+        return self._connection
+
+    def _traits_text(self, traits):
+        return repr(quantize_traits(traits, self.decimals))
+
+    def get_many(self, fingerprint, trait_sets):
+        connection = self._connect()
+        by_text = {self._traits_text(traits): traits for traits in trait_sets}
+        texts = list(by_text)
+        found = {}
+        for i in range(0, len(texts), _QUERY_CHUNK):
+            chunk = texts[i:i + _QUERY_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            rows = connection.execute(
+                f'SELECT traits, yield, growth_time FROM fitness WHERE fingerprint = ? AND traits IN ({placeholders})',
+                [fingerprint] + chunk
+            )
+            for text, yield_value, growth_time in rows:
+                found[by_text[text]] = (yield_value, growth_time)
+        self.hits += len(found)
+        self.misses += len(texts) - len(found)
+        return found
+
+    def put_many(self, fingerprint, results):
+        if not results:
+            return
+        rows = [(fingerprint, self._traits_text(traits), float(yield_value), int(growth_time))
+                for traits, (yield_value, growth_time) in results.items()]
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.executemany('INSERT OR IGNORE INTO fitness VALUES (?, ?, ?, ?)', rows)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        self.writes += len(rows)
+
+    def __len__(self):
+        return self._connect().execute('SELECT COUNT(*) FROM fitness').fetchone()[0]
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
+        self._pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_pid'] = None
+        return state
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+
+_default_store = None
+
+
+def default_fitness_store():
+    global _default_store
+    from settings import FITNESS_STORE_PATH
+    if FITNESS_STORE_PATH is None:
+        return None
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), FITNESS_STORE_PATH)
+    if _default_store is None or _default_store.path != path:
+        _default_store = FitnessStore(path)
+    return _default_store
@@ -0,0 +1,399 @@
+import random
+from typing import List
+
+import numpy as np
+
+from decoding import DIPLOID, CompiledDecoder
+from evaluation import FitnessEvaluator, default_evaluator, trait_key
+from genome import GenomePopulation, PackedGenomes, genotype_diversity
+from selection import select_parents, truncation
+from stopping import AdaptiveMutation, StoppingRules, stop_report
+from surrogate import SurrogateScreen
+from settings import ITERATIONS, MUTATION_RATE, POPULATION_SIZE
+
+
+#Общая часть Plant_1/Plant_2: растение с геномом в кодировке encoding.
+#Конфигурации признаков и скомпилированный декодер хранятся на уровне подкласса.
+class Plant:
+    _configs = None
+    _decoder = None
+    encoding = DIPLOID
+
+    def __init__(self, genome):
+        self.genome = genome
+        self._traits = None
+
+    @classmethod
+    def set_configs(cls, configs):
+        cls._configs = configs
+        cls._decoder = CompiledDecoder(configs, cls.encoding)
+
+    @classmethod
+    def get_decoder(cls) -> CompiledDecoder:
+        if cls._decoder is None or cls._decoder.configs != list(cls._configs):
+            cls._decoder = CompiledDecoder(cls._configs, cls.encoding)
+        return cls._decoder
+
+    #Упакованные геномы популяции: 64 бита генома на слово uint64
+    @classmethod
+    def pack_population(cls, population) -> PackedGenomes:
+        return PackedGenomes.from_bits(np.stack([ind.genome for ind in population]), cls.encoding.bits_per_locus)
+
+    #Декодирует всю популяцию одним вызовом и сохраняет признаки в особях
+    @classmethod
+    def decode_population(cls, population) -> np.ndarray:
+        pending = [ind for ind in population if ind._traits is None]
+        if pending:
+            traits_matrix = cls.get_decoder().decode(np.stack([ind.genome for ind in pending]))
+            for ind, traits in zip(pending, traits_matrix.tolist()):
+                ind._traits = tuple(traits)
+        return np.array([ind._traits for ind in population])
+
+    def decode_snp(self, idx: int) -> int:
+        return int(self.encoding.values(self.genome, np.array([idx]))[0, 0])
+
+    def decode_traits(self) -> List[float]:
+        if self._traits is None:
+            self._traits = tuple(self.get_decoder().decode(self.genome)[0].tolist())
+        return list(self._traits)
+
+    def calculate_fitness(self, use_cache=False):
+        traits = self.decode_traits()
+        # Сначала постоянное хранилище (и кэш в памяти при use_cache), моделирование - только при промахе
+        return default_evaluator().evaluate([traits], use_cache=use_cache)[trait_key(traits)]
+
+
+def create_plants(plant_cls, size, n_loci):
+    length = n_loci * plant_cls.encoding.bits_per_locus
+    return [plant_cls(np.random.randint(0, 2, length).astype(np.uint8)) for _ in range(size)]
+
+
+#Двухточечный кроссинговер двух растений
+def crossover_plants(p1: Plant, p2: Plant) -> Plant:
+    pts = sorted(random.sample(range(1, len(p1.genome)), 2))
+    child_genome = np.concatenate([
+        p1.genome[:pts[0]],
+        p2.genome[pts[0]:pts[1]],
+        p1.genome[pts[1]:]
+    ])
+    return type(p1)(child_genome)
+
+
+#Мутация по локусам: вероятность растет к концу генома, у локуса инвертируются все его биты
+def mutate_plant(ind: Plant, base_rate: float = MUTATION_RATE) -> Plant:
+    genome = ind.genome.copy()
+    length = len(genome)
+    bits = ind.encoding.bits_per_locus
+    for i in range(0, length, bits):
+        mutation_prob = base_rate * (1 + i / length)
+        if random.random() < mutation_prob:
+            genome[i:i + bits] ^= 1
+    return type(ind)(genome)
+
+
+#Оценивает все строки матрицы признаков одним набором; повторы и уже известные признаки берутся из кэша
+def evaluate_traits_matrix(traits_matrix, evaluator) -> np.ndarray:
+    keys = [trait_key(traits) for traits in traits_matrix.tolist()]
+    values = evaluator.evaluate(keys)
+    return np.array([values[key] for key in keys])
+
+
+#Состояние векторизованного ГА над матрицей геномов для любого подкласса Plant.
+#step() проводит одно поколение; emigrants()/immigrate() обмениваются особями с другими популяциями.
+#Приспособленность популяции переносится между поколениями, а не пересчитывается.
+#С surrogate (SurrogateScreen) часть потомков получает прогноз вместо моделирования; такие особи
+#моделируются по-настоящему, как только попадают в пул родителей или элиту.
+class OptimizedGA:
+    def __init__(self, configs, plant_cls, n_loci, evaluator: FitnessEvaluator = None,
+                 population_size=POPULATION_SIZE, mutation_rate=MUTATION_RATE, selection='truncation',
+                 tournament_size=3, adaptive_mutation: AdaptiveMutation = None, surrogate: SurrogateScreen = None):
+        plant_cls.set_configs(configs)
+        self.configs = configs
+        self.plant_cls = plant_cls
+        self.decoder = plant_cls.get_decoder()
+        self.encoding = plant_cls.encoding
+        self.owns_evaluator = evaluator is None
+        self.evaluator = evaluator if evaluator is not None else FitnessEvaluator()
+        self.population_size = population_size
+        self.selection = selection
+        self.tournament_size = tournament_size
+        self.adaptive_mutation = adaptive_mutation
+        self.rate = mutation_rate
+
+        self.elite_size = int(population_size * 0.1)
+        self.pool_size = int(population_size * 0.4)
+        self.n_children = population_size - self.elite_size
+
+        self.population = GenomePopulation.random(population_size, max(n_loci, self.decoder.n_loci),
+                                                  self.encoding.bits_per_locus)
+        self.population_raw = self.decoder.raw_scores(self.population.genomes)
+        self.population_fitness = None
+        self.predicted = np.zeros(population_size, dtype=bool)
+        self.requests = 0
+        self.surrogate = surrogate
+        if surrogate is not None:
+            surrogate.bind(self.decoder.value_low, self.decoder.value_high)
+        self.elite = None
+        self.elite_raw = None
+        self.elite_fitness = None
+        self.elite_index = None
+        self.generation = 0
+        self.fitness_history = []
+        self.diversity_history = []
+        self.snp_history = []
+
+    def step(self):
+        decoder = self.decoder
+        population = self.population
+        population_raw = self.population_raw
+
+        traits_matrix = decoder.traits_from_raw(population_raw)
+        self.snp_history.append({f'param_{i}': np.mean(traits_matrix[:, i]) for i in range(len(self.configs))})
+
+        if self.population_fitness is None:
+            fitness = self._evaluate(traits_matrix)
+        else:
+            fitness = self.population_fitness
+
+        # Частичная сортировка: нужны только лучшие особи для элиты и пула родителей.
+        # Прогнозы суррогата в пуле заменяются настоящим моделированием, пока пул не станет точным.
+        pool = max(self.pool_size, self.elite_size, 1)
+        order = truncation(fitness, pool)
+        while self.predicted[order].any():
+            unverified = order[self.predicted[order]]
+            fitness[unverified] = self._evaluate(traits_matrix[unverified], verified=True)
+            self.predicted[unverified] = False
+            order = truncation(fitness, pool)
+        if self.elite is None or fitness[order[0]] > self.elite_fitness:
+            self.elite = population.genomes[order[0]].copy()
+            self.elite_raw = population_raw[order[0]].copy()
+            self.elite_fitness = fitness[order[0]]
+            self.elite_index = order[0]
+
+        # Элита отслеживается по индексу: она либо переходит в новую популяцию среди лучших,
+        # либо заменяет последнюю особь
+        carried = order[:self.elite_size]
+        elite_position = np.flatnonzero(carried == self.elite_index) if self.elite_index is not None else []
+        self.elite_index = int(elite_position[0]) if len(elite_position) else None
+
+        parents_a, parents_b = select_parents(fitness, self.n_children, self.selection, self.pool_size, order,
+                                              self.tournament_size)
+        offspring = population.crossover(parents_a, parents_b).mutate(self.rate)
+
+        # Сырые оценки потомков обновляются только по изменившимся локусам
+        offspring_raw = decoder.rescore(population_raw, population, offspring)
+        offspring_fitness, offspring_predicted = self._evaluate_offspring(decoder.traits_from_raw(offspring_raw))
+
+        population = population.take(carried).concatenate(offspring)
+        population_raw = np.concatenate([population_raw[carried], offspring_raw])
+        population_fitness = np.concatenate([fitness[carried], offspring_fitness])
+        self.predicted = np.concatenate([self.predicted[carried], offspring_predicted])
+
+        if self.elite_index is None:
+            population.genomes[-1] = self.elite
+            population_raw[-1] = self.elite_raw
+            population_fitness[-1] = self.elite_fitness
+            self.predicted[-1] = False
+            self.elite_index = len(population) - 1
+
+        self.population = population
+        self.population_raw = population_raw
+        self.population_fitness = population_fitness
+        self.generation += 1
+
+        self.fitness_history.append(fitness[order[0]])
+        self.diversity_history.append(np.std(population_fitness) / np.mean(population_fitness))
+
+    def _evaluate(self, traits_matrix, verified=False):
+        self.requests += len(traits_matrix)
+        values = evaluate_traits_matrix(traits_matrix, self.evaluator)
+        if self.surrogate is not None:
+            self.surrogate.observe(traits_matrix, values, verified)
+        return values
+
+    #Приспособленность потомков и маска тех, у кого вместо урожая стоит прогноз суррогата
+    def _evaluate_offspring(self, traits_matrix):
+        if self.surrogate is None:
+            return self._evaluate(traits_matrix), np.zeros(len(traits_matrix), dtype=bool)
+        chosen, predicted = self.surrogate.screen(traits_matrix)
+        values = np.empty(len(traits_matrix))
+        if predicted is not None:
+            values[~chosen] = predicted[~chosen]
+        values[chosen] = self._evaluate(traits_matrix[chosen])
+        self.surrogate.record(self.generation, chosen, predicted, values[chosen])
+        return values, ~chosen
+
+    def genotype_diversity(self):
+        return genotype_diversity(self.population, self.encoding)
+
+    #Новая частота мутаций по нормированному генотипическому разнообразию (если задана AdaptiveMutation)
+    def adapt(self, genotypic):
+        if self.adaptive_mutation is not None:
+            self.rate = self.adaptive_mutation.update(genotypic)
+        return self.rate
+
+    def snapshot(self):
+        return [(genome.copy(), value) for genome, value in zip(self.population.genomes, self.population_fitness)]
+
+    #k лучших особей текущей популяции: (упакованные геномы, сырые оценки, приспособленность)
+    def emigrants(self, k):
+        best = truncation(self.population_fitness, k)
+        return self.population.take(best).pack(), self.population_raw[best].copy(), self.population_fitness[best].copy()
+
+    #Мигранты замещают худших особей; элита не замещается
+    def immigrate(self, packed, raw, fitness):
+        ranked = truncation(-self.population_fitness, len(self.population_fitness))
+        worst = ranked[ranked != self.elite_index][:len(fitness)]
+        self.population.genomes[worst] = packed.unpack().genomes[:len(worst)]
+        self.population_raw[worst] = raw[:len(worst)]
+        self.population_fitness[worst] = fitness[:len(worst)]
+        self.predicted[worst] = False
+
+    def best_plant(self):
+        best = int(np.argmax(self.population_fitness))
+        while self.predicted[best]:
+            traits = self.decoder.traits_from_raw(self.population_raw[best])
+            self.population_fitness[best] = self._evaluate(traits, verified=True)[0]
+            self.predicted[best] = False
+            best = int(np.argmax(self.population_fitness))
+        return self.plant_cls(self.population.genomes[best].copy())
+
+    def close(self):
+        if self.owns_evaluator:
+            self.evaluator.close()
+
+
+#Векторизованный ГА над матрицей геномов для любого подкласса Plant.
+#stats - словарь, в который по поколениям пишется генотипическое разнообразие (genotype_diversity).
+#selection - выбор родителей: 'truncation' (из 40% лучших), 'tournament' или 'sus' (см. selection.py).
+#stopping (StoppingRules) может остановить запуск раньше iterations поколений, adaptive_mutation
+#(AdaptiveMutation) меняет частоту мутаций по генотипическому разнообразию, surrogate (SurrogateScreen)
+#отсеивает потомков до моделирования; причина остановки, сэкономленные оценки и точность суррогата
+#пишутся в stats.
+#Возвращает (лучшее растение, fitness_history, diversity_history, snp_history, snapshots).
+def genetic_algorithm_optimized(configs, plant_cls, n_loci, evaluator: FitnessEvaluator = None, stats: dict = None,
+                                population_size=POPULATION_SIZE, iterations=ITERATIONS,
+                                mutation_rate=MUTATION_RATE, selection='truncation', tournament_size=3,
+                                stopping: StoppingRules = None, adaptive_mutation: AdaptiveMutation = None,
+                                surrogate: SurrogateScreen = None):
+
+    ga = OptimizedGA(configs, plant_cls, n_loci, evaluator, population_size, mutation_rate, selection,
+                     tournament_size, adaptive_mutation, surrogate)
+    snapshots = []
+    reason = 'iterations'
+    simulations_start = ga.evaluator.evaluations
+    if stopping is not None:
+        stopping.start()
+
+    for iteration in range(iterations):
+        ga.step()
+
+        genotypic = None
+        if stats is not None or adaptive_mutation is not None or (stopping is not None and stopping.needs_diversity):
+            genotypic = ga.genotype_diversity()
+            if stats is not None:
+                stats.setdefault('genotypic_diversity', []).append(genotypic)
+            genotypic = genotypic['mean_distance'] / ga.population.genome_length
+        if adaptive_mutation is not None:
+            rate = ga.adapt(genotypic)
+            if stats is not None:
+                stats.setdefault('mutation_rate', []).append(rate)
+
+        stop = None
+        if stopping is not None:
+            stop = stopping.check(iteration, ga.elite_fitness, genotypic, ga.evaluator.evaluations - simulations_start)
+
+        if iteration == 0 or iteration == iterations // 2 or iteration == iterations - 1 or stop is not None:
+            snapshots.append(ga.snapshot())
+
+        if stop is not None:
+            reason = stop
+            break
+
+    best = ga.best_plant()
+    if stats is not None:
+        stats.update(stop_report(reason, ga.generation, iterations, ga.requests, ga.n_children,
+                                 ga.evaluator.evaluations - simulations_start))
+        if surrogate is not None:
+            stats.update(surrogate.summary())
+    ga.close()
+
+    return best, ga.fitness_history, ga.diversity_history, ga.snp_history, snapshots
+
+
+#Простой ГА над списком растений: случайные пары, кроссинговер и мутация по одному потомку.
+#stopping и adaptive_mutation - как в genetic_algorithm_optimized.
+#Возвращает (лучшее растение, diversity_history).
+def genetic_algorithm_basic(configs, plant_cls, n_loci, evaluator: FitnessEvaluator = None, stats: dict = None,
+                            population_size=POPULATION_SIZE, iterations=ITERATIONS, mutation_rate=MUTATION_RATE,
+                            stopping: StoppingRules = None, adaptive_mutation: AdaptiveMutation = None):
+
+    owns_evaluator = evaluator is None
+    if owns_evaluator:
+        evaluator = FitnessEvaluator()
+
+    population = create_plants(plant_cls, population_size, n_loci)
+    best_plant = None
+    best_fitness = 0.0
+    diversity_history = []
+    fitness_history = []
+    rate = mutation_rate
+    reason = 'iterations'
+    generations = 0
+    simulations_start = evaluator.evaluations
+    if stopping is not None:
+        stopping.start()
+
+    for iteration in range(iterations):
+        new_population = []
+        fitness_table = evaluator.evaluate(ind.decode_traits() for ind in population)
+        fitness_values = [fitness_table[trait_key(ind.decode_traits())] for ind in population]
+
+        best_index = int(np.argmax(fitness_values))
+        current_best = population[best_index]
+        current_fitness = fitness_values[best_index]
+        fitness_history.append(current_fitness)
+
+        for i in range(population_size):
+            parent1, parent2 = random.sample(population, 2)
+            child = crossover_plants(parent1, parent2)
+
+            child = mutate_plant(child, base_rate=rate)
+
+            new_population.append(child)
+
+        population = new_population
+
+        if current_fitness > best_fitness:
+            best_plant = current_best
+            best_fitness = current_fitness
+
+        diversity = np.std(fitness_values) / np.mean(fitness_values) if np.mean(fitness_values) != 0 else 0
+        diversity_history.append(diversity)
+
+        genotypic = None
+        if stats is not None or adaptive_mutation is not None or (stopping is not None and stopping.needs_diversity):
+            packed = plant_cls.pack_population(population)
+            genotypic = genotype_diversity(packed, plant_cls.encoding)
+            if stats is not None:
+                stats.setdefault('genotypic_diversity', []).append(genotypic)
+            genotypic = genotypic['mean_distance'] / packed.genome_length
+        if adaptive_mutation is not None:
+            rate = adaptive_mutation.update(genotypic)
+            if stats is not None:
+                stats.setdefault('mutation_rate', []).append(rate)
+
+        generations = iteration + 1
+        if stopping is not None:
+            stop = stopping.check(iteration, best_fitness, genotypic, evaluator.evaluations - simulations_start)
+            if stop is not None:
+                reason = stop
+                break
+
+    if stats is not None:
+        stats.update(stop_report(reason, generations, iterations, generations * population_size, population_size,
+                                 evaluator.evaluations - simulations_start))
+    if owns_evaluator:
+        evaluator.close()
+
+    return best_plant, diversity_history
@@ -0,0 +1,184 @@
+import numpy as np
+
+from decoding import DIPLOID, get_encoding
+
+
+#Без явного генератора используется глобальный np.random, засеянный в settings
+def _uniform(rng, size):
+    return (rng if rng is not None else np.random).random(size)
+
+
+def _integers(rng, low, high, size):
+    if rng is None:
+        return np.random.randint(low, high, size)
+    if isinstance(rng, np.random.RandomState):
+        return rng.randint(low, high, size)
+    return rng.integers(low, high, size)
+
+
+#Популяция как одна матрица (особи x биты) uint8.
+#bits_per_locus = 2 для диплоидного кода Plant_1, 1 для гаплоидного Plant_2.
+#Потомки от crossover/mutate помнят происхождение: parents - строка первого родителя в исходной
+#популяции, changed - пары (строка, локус), где потомок может отличаться от этого родителя.
+class GenomePopulation:
+    def __init__(self, genomes, bits_per_locus=1, parents=None, changed=None):
+        genomes = np.atleast_2d(np.asarray(genomes))
+        if genomes.shape[1] % bits_per_locus:
+            raise ValueError(f"genome length {genomes.shape[1]} is not a multiple of {bits_per_locus}")
+        self.genomes = np.ascontiguousarray(genomes, dtype=np.uint8)
+        self.bits_per_locus = bits_per_locus
+        self.parents = parents
+        self.changed = changed
+
+    @classmethod
+    def random(cls, size, n_loci, bits_per_locus=1, rng=None):
+        genomes = _integers(rng, 0, 2, (size, n_loci * bits_per_locus)).astype(np.uint8)
+        return cls(genomes, bits_per_locus)
+
+    def __len__(self):
+        return self.genomes.shape[0]
+
+    @property
+    def genome_length(self):
+        return self.genomes.shape[1]
+
+    @property
+    def n_loci(self):
+        return self.genomes.shape[1] // self.bits_per_locus
+
+    def take(self, indices):
+        return GenomePopulation(self.genomes[np.asarray(indices, dtype=np.intp)], self.bits_per_locus)
+
+    def concatenate(self, other):
+        return GenomePopulation(np.concatenate([self.genomes, other.genomes]), self.bits_per_locus)
+
+    #Двухточечный кроссинговер для всех потомков сразу: участок [lo, hi) берется от второго родителя
+    def crossover(self, parents_a, parents_b, rng=None):
+        parents_a = np.asarray(parents_a, dtype=np.intp)
+        parents_b = np.asarray(parents_b, dtype=np.intp)
+        n = len(parents_a)
+        length = self.genome_length
+
+        # Две различные точки из range(1, length), как random.sample(range(1, length), 2)
+        first = _integers(rng, 1, length, n)
+        second = _integers(rng, 1, length - 1, n)
+        second = second + (second >= first)
+        lo = np.minimum(first, second)
+        hi = np.maximum(first, second)
+
+        positions = np.arange(length)
+        from_b = (positions >= lo[:, None]) & (positions < hi[:, None])
+        genomes_a = self.genomes[parents_a]
+        genomes_b = self.genomes[parents_b]
+        children = np.where(from_b, genomes_b, genomes_a)
+
+        # Локусы, где участок второго родителя действительно отличается от первого
+        swapped = (from_b & (genomes_a != genomes_b)).reshape(n, self.n_loci, self.bits_per_locus).any(axis=2)
+        return GenomePopulation(children, self.bits_per_locus, parents=parents_a, changed=np.nonzero(swapped))
+
+    def mutation_rates(self, base_rate):
+        locus_start = np.arange(self.n_loci) * self.bits_per_locus
+        return base_rate * (1 + locus_start / self.genome_length)
+
+    #Мутация всех локусов одной матрицей бернуллиевских испытаний; у локуса инвертируются все его биты
+    def mutate(self, base_rate, rng=None):
+        locus_flips = _uniform(rng, (len(self), self.n_loci)) < self.mutation_rates(base_rate)
+        flips = locus_flips
+        if self.bits_per_locus > 1:
+            flips = np.repeat(locus_flips, self.bits_per_locus, axis=1)
+        genomes = self.genomes ^ flips.astype(np.uint8)
+
+        # Изменения считаются от первого родителя, если популяция сама получена кроссинговером
+        parents = self.parents if self.parents is not None else np.arange(len(self))
+        flip_rows, flip_loci = np.nonzero(locus_flips)
+        codes = flip_rows * self.n_loci + flip_loci
+        if self.changed is not None:
+            rows, loci = self.changed
+            codes = np.union1d(rows * self.n_loci + loci, codes)
+        changed = (codes // self.n_loci, codes % self.n_loci)
+        return GenomePopulation(genomes, self.bits_per_locus, parents=parents, changed=changed)
+
+    def plants(self, plant_cls):
+        return [plant_cls(genome) for genome in self.genomes]
+
+    def pack(self):
+        return PackedGenomes.from_bits(self.genomes, self.bits_per_locus)
+
+
+#Число единичных битов в каждом байте - для numpy без np.bitwise_count
+_BYTE_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1).astype(np.uint8)
+
+
+def popcount(words):
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    counts = _BYTE_POPCOUNT[words.view(np.uint8)].reshape(words.shape + (words.itemsize,))
+    return counts.sum(axis=-1, dtype=np.uint32)
+
+
+#Упакованные геномы: по 64 бита генома в одном слове uint64 (в 8 раз меньше uint8, в 64 раза меньше int64).
+#Расстояние Хэмминга - XOR слов и подсчет единичных битов.
+class PackedGenomes:
+    def __init__(self, words, genome_length, bits_per_locus=1):
+        self.words = words
+        self.genome_length = genome_length
+        self.bits_per_locus = bits_per_locus
+
+    @classmethod
+    def from_bits(cls, genomes, bits_per_locus=1):
+        genomes = np.atleast_2d(np.asarray(genomes, dtype=np.uint8))
+        length = genomes.shape[1]
+        packed = np.packbits(genomes, axis=1)
+        padding = -packed.shape[1] % 8
+        if padding:
+            packed = np.pad(packed, ((0, 0), (0, padding)))
+        return cls(np.ascontiguousarray(packed).view(np.uint64), length, bits_per_locus)
+
+    def __len__(self):
+        return self.words.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    def unpack(self):
+        bits = np.unpackbits(self.words.view(np.uint8), axis=1, count=self.genome_length)
+        return GenomePopulation(bits, self.bits_per_locus)
+
+    def hamming(self, i, j):
+        return int(popcount(self.words[i] ^ self.words[j]).sum())
+
+    #Матрица попарных расстояний блоками строк; промежуточный XOR не больше block_bytes
+    def pairwise_distances(self, block_bytes=16 * 2 ** 20):
+        n, n_words = self.words.shape
+        block = max(1, block_bytes // max(1, n * n_words * 8))
+        distances = np.zeros((n, n), dtype=np.int64)
+        for start in range(0, n, block):
+            rows = self.words[start:start + block]
+            distances[start:start + block] = popcount(rows[:, None, :] ^ self.words[None, :, :]).sum(axis=2)
+        return distances
+
+    #Среднее попарное расстояние без матрицы n x n: бит с c единицами различает c * (n - c) пар
+    def mean_pairwise_distance(self):
+        n = len(self)
+        if n < 2:
+            return 0.0
+        ones = np.unpackbits(self.words.view(np.uint8), axis=1, count=self.genome_length).sum(axis=0, dtype=np.int64)
+        return float(2 * np.sum(ones * (n - ones)) / (n * (n - 1)))
+
+
+#Генотипическое разнообразие популяции: среднее попарное расстояние Хэмминга, частота аллеля
+#по локусам (доля от максимального значения SNP) и гетерозиготность для диплоидного кода
+def genotype_diversity(population, encoding='diploid'):
+    encoding = get_encoding(encoding)
+    packed = population if isinstance(population, PackedGenomes) else population.pack()
+    values = encoding.values(packed.unpack().genomes)
+    frequency = values.mean(axis=0) / encoding.max_value
+    stats = {
+        'mean_distance': packed.mean_pairwise_distance(),
+        'allele_frequency': frequency,
+        'expected_heterozygosity': float(np.mean(2 * frequency * (1 - frequency))),
+    }
+    if encoding is DIPLOID:
+        stats['heterozygosity'] = float(np.mean(values == 1))
+    return stats
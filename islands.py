@@ -0,0 +1,176 @@
+import multiprocessing as mp
+import random
+import traceback
+
+import numpy as np
+
+from evaluation import FitnessEvaluator
+from ga import OptimizedGA
+from settings import ITERATIONS, MUTATION_RATE, POPULATION_SIZE
+
+TOPOLOGIES = ('ring', 'full')
+
+
+#Откуда каждый остров получает мигрантов: ring - от предыдущего острова, full - от всех остальных
+def migration_sources(n_islands, topology='ring'):
+    if topology == 'ring':
+        return [[(i - 1) % n_islands] for i in range(n_islands)] if n_islands > 1 else [[]]
+    if topology == 'full':
+        return [[j for j in range(n_islands) if j != i] for i in range(n_islands)]
+    raise ValueError(f"topology must be one of {TOPOLOGIES}, got {topology!r}")
+
+
+#Процесс одного острова: держит свой OptimizedGA и по команде проводит несколько поколений.
+#По каналу передаются только упакованные геномы, сырые оценки и приспособленность.
+#Исключение острова не теряется: его traceback уходит родителю вместо ответа.
+def _island_worker(conn, seed, configs, plant_cls, n_loci, population_size, mutation_rate, selection,
+                   tournament_size, n_migrants, evaluator_options):
+    np.random.seed(seed)
+    random.seed(seed)
+    ga = None
+    try:
+        ga = OptimizedGA(configs, plant_cls, n_loci, FitnessEvaluator(**evaluator_options), population_size,
+                         mutation_rate, selection, tournament_size)
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            generations, snapshot_at, immigrants = message
+            if immigrants is not None:
+                ga.immigrate(*immigrants)
+
+            records = []
+            for _ in range(generations):
+                ga.step()
+                snapshot = None
+                if ga.generation - 1 in snapshot_at:
+                    snapshot = (ga.population.pack(), ga.population_fitness.copy())
+                records.append((ga.fitness_history[-1], ga.population_fitness.copy(), ga.snp_history[-1], snapshot))
+            conn.send((records, ga.emigrants(n_migrants), ga.evaluator.evaluations))
+    except Exception:
+        try:
+            conn.send(RuntimeError(traceback.format_exc()))
+        except OSError:
+            pass
+    finally:
+        if ga is not None:
+            ga.close()
+        conn.close()
+
+
+#Ответ острова island; упавший или завершившийся остров превращается в RuntimeError родителя
+def _receive(conn, island):
+    try:
+        reply = conn.recv()
+    except (EOFError, OSError):
+        raise RuntimeError(f"island {island} exited without a reply") from None
+    if isinstance(reply, BaseException):
+        raise RuntimeError(f"island {island} failed:\n{reply}")
+    return reply
+
+
+#Лучшие n среди мигрантов от всех источников острова
+def _select_immigrants(emigrants, sources, n):
+    if not sources:
+        return None
+    packed = [emigrants[j][0] for j in sources]
+    genomes = np.concatenate([p.unpack().genomes for p in packed])
+    raw = np.concatenate([emigrants[j][1] for j in sources])
+    fitness = np.concatenate([emigrants[j][2] for j in sources])
+    best = np.argsort(-fitness, kind='stable')[:n]
+    return type(packed[0]).from_bits(genomes[best], packed[0].bits_per_locus), raw[best], fitness[best]
+
+
+#Островная модель: n_islands популяций по population_size особей развиваются в отдельных процессах,
+#каждые interval поколений лучшие n_migrants особей переходят по топологии topology ('ring' или 'full').
+#evaluator_options - аргументы FitnessEvaluator, с которыми каждый остров строит свой оценщик
+#(например {'store': False} или {'config': make_config(...)}).
+#Ошибка любого острова поднимается здесь как RuntimeError с его traceback, остальные острова завершаются.
+#Возвращает то же, что genetic_algorithm_optimized, по объединенной популяции всех островов.
+def genetic_algorithm_islands(configs, plant_cls, n_loci, n_islands=4, topology='ring', interval=10, n_migrants=2,
+                              population_size=POPULATION_SIZE, iterations=ITERATIONS, mutation_rate=MUTATION_RATE,
+                              selection='truncation', tournament_size=3, seed=None, stats: dict = None,
+                              evaluator_options: dict = None):
+    plant_cls.set_configs(configs)
+    evaluator_options = evaluator_options or {}
+    sources = migration_sources(n_islands, topology)
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(n_islands)]
+    snapshot_at = {0, iterations // 2, iterations - 1}
+
+    context = mp.get_context()
+    connections = []
+    processes = []
+    for i in range(n_islands):
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(target=_island_worker, args=(
+            child_conn, seeds[i], configs, plant_cls, n_loci, population_size, mutation_rate, selection,
+            tournament_size, n_migrants, evaluator_options), daemon=True)
+        process.start()
+        child_conn.close()
+        connections.append(parent_conn)
+        processes.append(process)
+
+    fitness_history = []
+    diversity_history = []
+    snp_history = []
+    snapshots = []
+    immigrants = [None] * n_islands
+    emigrants = []
+    simulations = [0] * n_islands
+    migrations = 0
+
+    failed = True
+    try:
+        done = 0
+        while done < iterations:
+            generations = min(interval, iterations - done)
+            for i, conn in enumerate(connections):
+                try:
+                    conn.send((generations, snapshot_at, immigrants[i]))
+                except OSError:
+                    _receive(conn, i)
+                    raise
+            replies = [_receive(conn, i) for i, conn in enumerate(connections)]
+            emigrants = [reply[1] for reply in replies]
+            simulations = [reply[2] for reply in replies]
+
+            for g in range(generations):
+                records = [reply[0][g] for reply in replies]
+                fitness_history.append(max(record[0] for record in records))
+                merged_fitness = np.concatenate([record[1] for record in records])
+                diversity_history.append(np.std(merged_fitness) / np.mean(merged_fitness))
+                snp_history.append({key: np.mean([record[2][key] for record in records]) for key in records[0][2]})
+                if records[0][3] is not None:
+                    snapshot = []
+                    for packed, values in (record[3] for record in records):
+                        snapshot.extend(zip(packed.unpack().genomes, values))
+                    snapshots.append(snapshot)
+
+            done += generations
+            if done < iterations:
+                immigrants = [_select_immigrants(emigrants, sources[i], n_migrants) for i in range(n_islands)]
+                migrations += 1
+        failed = False
+    finally:
+        for conn in connections:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            conn.close()
+        for process in processes:
+            if failed:
+                process.terminate()
+            process.join()
+
+    if stats is not None:
+        stats.update({
+            'islands': n_islands,
+            'topology': topology,
+            'migrations': migrations,
+            'simulations': sum(simulations),
+        })
+
+    best_island = int(np.argmax([e[2][0] for e in emigrants]))
+    best_genome = emigrants[best_island][0].unpack().genomes[0]
+    return plant_cls(best_genome.copy()), fitness_history, diversity_history, snp_history, snapshots
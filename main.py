@@ -1,5 +1,7 @@
 from population import genetic_algorithm_basic_1, genetic_algorithm_optimized_1, generate_configs_1, Plant_1
 from model import calculate_yield
+from ensemble import run_ensemble
+from fitness_cache import shared_fitness_cache
 from settings import *
 from plot import *
 from population_2 import generate_configs_2, Plant_2, genetic_algorithm_optimized_2, genetic_algorithm_basic_2
@@ -62,16 +64,9 @@ if __name__ == "__main__":
     start_days = []
     all_simulations_data = []
 
-    for _ in range(num_simulations):
-        yield_total_2, results_2, growth_times_2, cap_hist_2, leaf_hist_2, stem_hist_2, grain_hist_2 = calculate_yield(
-            days=DAYS,
-            grain_params=(FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION),
-            initial_biomass=SEED_MASS,
-            temperatures=temperatures,
-            latitude=55.7,
-            traits=traits_optimized_1
-        )
+    ensemble_results = run_ensemble(traits_optimized_1, num_simulations, seed=42, trace='full')
 
+    for yield_total_2, results_2, growth_times_2, cap_hist_2, leaf_hist_2, stem_hist_2, grain_hist_2 in ensemble_results:
         all_simulations_data.append(results_2)
 
         first_yield_day = next((i for i, r in enumerate(results_2) if r[6] > 0), None)
@@ -180,6 +175,10 @@ if __name__ == "__main__":
     print(f"- Эффективность фотосинтеза: {traits_optimized[2]:.3f}")
     print(f"- Термотолерантность: {traits_optimized[3]:.1f}°C")
 
+    cache_stats = shared_fitness_cache().stats()
+    print(f"\nКэш приспособленности: {cache_stats['entries']} записей, "
+          f"попаданий {cache_stats['hit_rate'] * 100:.1f} %, вытеснений {cache_stats['evictions']}")
+
     print_results(results_basic, "Базовый алгоритм - динамика роста")
     print_results(results_optimized, "Оптимизированный алгоритм - динамика роста")
 
@@ -263,6 +262,10 @@ if __name__ == "__main__":
     print(f"- Эффективность фотосинтеза: {traits_optimized_2[2]:.3f}")
     print(f"- Термотолерантность: {traits_optimized_2[3]:.1f}°C")
 
+    cache_stats = shared_fitness_cache().stats()
+    print(f"\nКэш приспособленности: {cache_stats['entries']} записей, "
+          f"попаданий {cache_stats['hit_rate'] * 100:.1f} %, вытеснений {cache_stats['evictions']}")
+
     print_results(results_basic_2, "Базовый алгоритм - динамика роста")
     print_results(results_optimized_2, "Оптимизированный алгоритм - динамика роста")
 
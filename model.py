@@ -1,4 +1,6 @@
-import math, random, numpy as np
+import contextlib, copy, math, random, hashlib, pickle, numpy as np
+import settings
+from organs import PlantOrgans
 from settings import  CRPAR,  SEEDS_PER_CAPSULE, SOLAR_CONSTANT, CONVERSION_FACTORS, PP_PARAMS, STAGE_PARAMS, GROWTH_STAGES_BD
 
 random.seed(42)
@@ -60,6 +62,29 @@ def calculate_absorbed_PAR(leaf_area, leaf_angle, E_dir, E_dif):
 
     return total_absorbed
 
+#Расчет поглощенной PAR по накопленной сумме синусов углов листьев, O(1) на день
+def calculate_absorbed_PAR_running(leaf_area, sin_sum, num_leaves, E_dir, E_dif):
+    if not num_leaves or leaf_area <= 0:
+        return 0.0
+    area_per_leaf = leaf_area / num_leaves
+    leaf_PAR = (E_dir + E_dif) * CRPAR
+    return area_per_leaf * leaf_PAR * sin_sum
+
+def calculate_absorbed_PAR_batch_running(leaf_area, sin_sum, num_leaves, E_dir, E_dif):
+    leaf_area = np.asarray(leaf_area, dtype=float)
+    num_leaves = np.asarray(num_leaves)
+    active = (num_leaves > 0) & (leaf_area > 0)
+    leaf_PAR = (np.asarray(E_dir) + np.asarray(E_dif)) * CRPAR
+    area_per_leaf = leaf_area / np.where(active, num_leaves, 1)
+    return np.where(active, area_per_leaf * leaf_PAR * sin_sum, 0.0)
+
+#Векторный вариант для популяции: leaf_angles - матрица (особи x листья), пустые места заполнены NaN
+def calculate_absorbed_PAR_batch(leaf_area, leaf_angles, E_dir, E_dif):
+    leaf_angles = np.atleast_2d(np.asarray(leaf_angles, dtype=float))
+    present = ~np.isnan(leaf_angles)
+    sin_sum = np.where(present, np.sin(np.radians(np.where(present, leaf_angles, 0.0))), 0.0).sum(axis=1)
+    return calculate_absorbed_PAR_batch_running(leaf_area, sin_sum, present.sum(axis=1), E_dir, E_dif)
+
 def calculate_photosynthetic_production(absorbed_PAR, photosynthetic_efficiency):
     if absorbed_PAR <= 0:
         return 0.0
@@ -79,270 +104,874 @@ def calculate_cap(CAP_prev, P_t, C_mr):
 def calculate_biomass_increment(S_o, S_total, CAP_t):
     return min(S_o, (S_o / S_total) * CAP_t)
 
-def calculate_yield(days, grain_params, initial_biomass, temperatures, latitude, traits):
-    CAP = 0
-    yield_total = 0
-    total_biomass = initial_biomass
-    D_grain_values = []
-
-    sum_BD = 0.0
-    current_stage = 1
-    BD_history = []
-
-    leaf_angles = [traits[1]] * 12
-
-    t_grain_start, D_flower, t_grain_duration = grain_params
-    t_grain_end = t_grain_start + t_grain_duration
-
-    results = []
-
-    organs = {
-        'seed': {'biomass': initial_biomass, 'size': 0.0},
-        'leaf': {'biomass': 0.0, 'size': 0.0, 'count': 0, 'scale': 1.0, 'angles': leaf_angles},
-        'stem': {'biomass': 0.0, 'height': 0.0, 'branches': 0, 'diameter': 0.0},
-        'grain': {'biomass': 0.0, 'capsules': []},
-        'buds': [],
-        'flowers': [],
-        'fruits': []
-    }
-
-    sink_strength = {
-        'seed': 5.0,
-        'leaf': 0.0,
-        'stem': 0.0,
-        'grain': 0.0,
-        'buds': 0.0,
-        'flowers': 0.0,
-        'fruits': 0.0
-    }
-
-    allocation_ratio = traits[0]
-    photosynthetic_efficiency = traits[2]
-    temp_tolerance = traits[3]
-
-    To = 16 + temp_tolerance
-    Tc = 36 - temp_tolerance
+STAGE_TB = np.array([0] + [STAGE_PARAMS[s]['Tb'] for s in range(1, 12)], dtype=float)
+STAGE_TO = np.array([0] + [STAGE_PARAMS[s]['To'] for s in range(1, 12)], dtype=float)
+_STAGE_STARTS = np.array([GROWTH_STAGES_BD[s][0] for s in sorted(GROWTH_STAGES_BD)])
+_STAGE_ENDS = np.array([GROWTH_STAGES_BD[s][1] for s in sorted(GROWTH_STAGES_BD)])
+
+# Порядок стоков совпадает с порядком словаря sink_strength в calculate_yield
+SINK_ORDER = ('seed', 'leaf', 'stem', 'grain', 'buds', 'flowers', 'fruits')
+SEED, LEAF, STEM, GRAIN, BUDS, FLOWERS, FRUITS = range(len(SINK_ORDER))
+
+
+def get_growth_stage_bd_array(sum_bd):
+    sum_bd = np.asarray(sum_bd, dtype=float)
+    idx = np.searchsorted(_STAGE_STARTS, sum_bd, side='right') - 1
+    safe_idx = np.clip(idx, 0, len(_STAGE_STARTS) - 1)
+    inside = (idx >= 0) & (sum_bd <= _STAGE_ENDS[safe_idx])
+    return np.where(inside, safe_idx + 1, 11)
+
+
+def calculate_tempfun_array(T, Tb, To, Tc):
+    T, Tb, To, Tc = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (T, Tb, To, Tc)))
+    active = (T > Tb) & (T < Tc)
+    result = np.zeros(T.shape)
+    Ta, Tba, Toa, Tca = T[active], Tb[active], To[active], Tc[active]
+    result[active] = ((Tca - Ta) / (Tca - Toa)) * (((Ta - Tba) / (Toa - Tba)) ** ((Toa - Tba) / (Tca - Toa)))
+    return result
 
-    for t in range(1, days + 1):
-        previous_stage = current_stage
 
-        day_of_year = t
-        r_factor = calculate_earth_sun_distance_factor(day_of_year)
-        sin_beta = calculate_sin_beta(latitude, day_of_year)
+#Внешние условия сезона: зависят только от широты и ряда температур, но не от признаков растения
+class Forcing:
+    def __init__(self, latitude, temperatures, days):
+        self.latitude = latitude
+        self.days = days
+        self.weather_hash = weather_hash(temperatures)
+        self.key = (float(latitude), days, self.weather_hash)
+
+        day_of_year = np.arange(1, days + 1)
+        self.day_of_year = day_of_year
+        self.r_factor = np.array([calculate_earth_sun_distance_factor(t) for t in day_of_year])
+        self.sin_beta = np.array([calculate_sin_beta(latitude, t) for t in day_of_year])
+        self.E_dir = 0.85 * SOLAR_CONSTANT * self.r_factor * np.maximum(self.sin_beta, 0)
+        self.E_dif = 0.15 * SOLAR_CONSTANT * self.r_factor * np.maximum(self.sin_beta, 0)
+        self.day_length = np.array([calculate_day_length(t, latitude) for t in day_of_year])
+        self.ppf = np.array([calculate_ppfun(PP) for PP in self.day_length])
+        self.temperature = np.array([temperatures[t - 1] if t <= len(temperatures) else 10
+                                     for t in day_of_year], dtype=float)
 
-        E_dir = 0.85 * SOLAR_CONSTANT * r_factor * max(sin_beta, 0)
-        E_dif = 0.15 * SOLAR_CONSTANT * r_factor * max(sin_beta, 0)
+        for array in (self.day_of_year, self.r_factor, self.sin_beta, self.E_dir, self.E_dif,
+                      self.day_length, self.ppf, self.temperature):
+            array.setflags(write=False)
 
-        PP = calculate_day_length(t, latitude)
-        ppf = calculate_ppfun(PP)
-        T = temperatures[t - 1] if t <= len(temperatures) else 10
+    def __hash__(self):
+        return hash(self.key)
 
-        stage_params = STAGE_PARAMS.get(current_stage, {'Tb': 10, 'To': To, 'Tc': 36})
-        Tb = stage_params['Tb']
-        tempf = calculate_tempfun(T, Tb, To, Tc)
-        werf = 1.0
-        wsf = 1.0
+    def __eq__(self, other):
+        return isinstance(other, Forcing) and self.key == other.key
 
-        growth_coeff = tempf
 
-        BD_day = max(0.0, tempf * ppf * werf * wsf)
-        sum_BD += BD_day
-        BD_history.append(BD_day)
+def weather_hash(temperatures):
+    return hashlib.sha1(np.asarray(temperatures, dtype=float).tobytes()).hexdigest()
 
-        new_stage = get_growth_stage_bd(sum_BD)
-        if new_stage != current_stage:
-            current_stage = new_stage
-            stage_params = STAGE_PARAMS[current_stage]
-            Tb = stage_params['Tb']
-            To = stage_params['To']
+
+_forcing_cache = {}
+
+
+def get_forcing(latitude, temperatures, days):
+    key = (float(latitude), days, weather_hash(temperatures))
+    forcing = _forcing_cache.get(key)
+    if forcing is None:
+        forcing = Forcing(latitude, temperatures, days)
+        _forcing_cache[key] = forcing
+    return forcing
+
+
+#Фенология: ряд биологических дней и стадий зависит только от термотолерантности и условий сезона
+class Phenology:
+    def __init__(self, forcing, temp_tolerance, days):
+        self.temp_tolerance = temp_tolerance
+        self.days = days
+
+        T = forcing.temperature[:days]
+        ppf = forcing.ppf[:days]
+        Tc = 36 - temp_tolerance
+        To = 16 + temp_tolerance
+
+        stage = np.empty(days, dtype=int)
+        sum_bd = np.empty(days)
+        growth_coeff = np.empty(days)
+
+        # To меняется только при смене стадии, поэтому ряд считается кусками между переходами
+        t0 = 0
+        current_stage = 1
+        total = 0.0
+        while t0 < days:
+            tempf = calculate_tempfun_array(T[t0:], STAGE_TB[current_stage], To, Tc)
+            bd = np.maximum(0.0, tempf * ppf[t0:])
+            cumulative = np.cumsum(np.concatenate(([total], bd)))[1:]
+            stages = get_growth_stage_bd_array(cumulative)
+            changes = np.flatnonzero(stages != current_stage)
+            end = changes[0] + 1 if len(changes) else len(stages)
+
+            stage[t0:t0 + end] = stages[:end]
+            sum_bd[t0:t0 + end] = cumulative[:end]
+            growth_coeff[t0:t0 + end] = tempf[:end]
+
+            if len(changes):
+                current_stage = stages[changes[0]]
+                To = STAGE_TO[current_stage]
+            total = cumulative[end - 1]
+            t0 += end
+
+        self.stage = stage
+        self.sum_bd = sum_bd
+        self.growth_coeff = growth_coeff
+        self.previous_stage = np.concatenate(([1], stage[:-1]))
+
+        mature_days = np.flatnonzero(stage == 11)
+        self.growth_time = int(mature_days[0]) + 1 if len(mature_days) else days
+
+        for array in (self.stage, self.sum_bd, self.growth_coeff, self.previous_stage):
+            array.setflags(write=False)
+
+
+PHENOLOGY_CACHE_SIZE = 4096
+_phenology_cache = {}
+
+
+def get_phenology(forcing, temp_tolerance, days):
+    key = (forcing.key, days, float(temp_tolerance))
+    phenology = _phenology_cache.get(key)
+    if phenology is None:
+        if len(_phenology_cache) >= PHENOLOGY_CACHE_SIZE:
+            _phenology_cache.pop(next(iter(_phenology_cache)))
+        phenology = Phenology(forcing, float(temp_tolerance), days)
+        _phenology_cache[key] = phenology
+    return phenology
+
+
+
+#Версия поведения модели: увеличивается, когда при тех же константах меняется результат моделирования.
+#Входит в ключ кэша и хранилища приспособленности, чтобы старые значения не отдавались после изменений модели.
+#2 - число ветвей в LegacyRandom снова тянется из np.random.
+MODEL_VERSION = 2
+
+#Константы settings, которые можно временно подменить (анализ чувствительности, калибровка)
+PARAMETER_GROUPS = ('CRPAR', 'CONVERSION_FACTORS', 'PP_PARAMS', 'STAGE_PARAMS', 'GROWTH_STAGES_BD')
+_BASE_PARAMETERS = copy.deepcopy({name: getattr(settings, name) for name in PARAMETER_GROUPS})
+
+
+def default_parameters():
+    return copy.deepcopy(_BASE_PARAMETERS)
+
+
+#Действующие константы модели с учетом активного model_parameters
+def active_parameters():
+    return {name: globals()[name] for name in PARAMETER_GROUPS}
+
+
+#Применяет плоские переопределения к копии parameters. Имена:
+#'CRPAR', 'PP_PARAMS.<ключ>', 'CONVERSION_FACTORS.<ключ>', 'STAGE_PARAMS.<стадия>.<Tb|To|Tc>'
+#('*' вместо стадии - все стадии), 'GROWTH_STAGES_BD.<стадия>' - верхний порог суммы биологических дней
+#стадии, начало следующей стадии сдвигается вслед за ним.
+def apply_parameter_overrides(overrides, parameters=None):
+    parameters = copy.deepcopy(parameters if parameters is not None else _BASE_PARAMETERS)
+    for name, value in overrides.items():
+        group, *path = name.split('.')
+        if group not in PARAMETER_GROUPS:
+            raise ValueError(f"unknown model parameter {name!r}")
+        value = float(value)
+        if group == 'CRPAR' and not path:
+            parameters['CRPAR'] = value
+        elif group in ('PP_PARAMS', 'CONVERSION_FACTORS') and len(path) == 1 and path[0] in parameters[group]:
+            parameters[group][path[0]] = value
+        elif group == 'STAGE_PARAMS' and len(path) == 2:
+            stages = parameters[group] if path[0] == '*' else [int(path[0])]
+            for stage in stages:
+                if stage not in parameters[group] or path[1] not in parameters[group][stage]:
+                    raise ValueError(f"unknown model parameter {name!r}")
+                parameters[group][stage][path[1]] = value
+        elif group == 'GROWTH_STAGES_BD' and len(path) == 1 and int(path[0]) in parameters[group]:
+            bounds = parameters[group]
+            stage = int(path[0])
+            bounds[stage] = (bounds[stage][0], value)
+            if stage + 1 in bounds:
+                bounds[stage + 1] = (value + 0.001, bounds[stage + 1][1])
+        else:
+            raise ValueError(f"unknown model parameter {name!r}")
+
+    bounds = [parameters['GROWTH_STAGES_BD'][s] for s in sorted(parameters['GROWTH_STAGES_BD'])]
+    if any(start > end for start, end in bounds):
+        raise ValueError("growth stage thresholds must be increasing")
+    return parameters
+
+
+
+#Значение константы по плоскому имени из apply_parameter_overrides ('*' - значение первой стадии)
+def get_parameter(name, parameters=None):
+    parameters = parameters if parameters is not None else _BASE_PARAMETERS
+    group, *path = name.split('.')
+    if group not in PARAMETER_GROUPS:
+        raise ValueError(f"unknown model parameter {name!r}")
+    if group == 'CRPAR' and not path:
+        return float(parameters['CRPAR'])
+    try:
+        if group == 'STAGE_PARAMS' and len(path) == 2:
+            stage = min(parameters[group]) if path[0] == '*' else int(path[0])
+            return float(parameters[group][stage][path[1]])
+        if group == 'GROWTH_STAGES_BD' and len(path) == 1:
+            return float(parameters[group][int(path[0])][1])
+        if len(path) == 1:
+            return float(parameters[group][path[0]])
+    except (KeyError, ValueError):
+        pass
+    raise ValueError(f"unknown model parameter {name!r}")
+
+def _install_parameters(parameters):
+    global CRPAR, CONVERSION_FACTORS, PP_PARAMS, STAGE_PARAMS, GROWTH_STAGES_BD
+    global STAGE_TB, STAGE_TO, _STAGE_STARTS, _STAGE_ENDS
+    CRPAR = parameters['CRPAR']
+    CONVERSION_FACTORS = parameters['CONVERSION_FACTORS']
+    PP_PARAMS = parameters['PP_PARAMS']
+    STAGE_PARAMS = parameters['STAGE_PARAMS']
+    GROWTH_STAGES_BD = parameters['GROWTH_STAGES_BD']
+    STAGE_TB = np.array([0] + [STAGE_PARAMS[s]['Tb'] for s in range(1, 12)], dtype=float)
+    STAGE_TO = np.array([0] + [STAGE_PARAMS[s]['To'] for s in range(1, 12)], dtype=float)
+    _STAGE_STARTS = np.array([GROWTH_STAGES_BD[s][0] for s in sorted(GROWTH_STAGES_BD)])
+    _STAGE_ENDS = np.array([GROWTH_STAGES_BD[s][1] for s in sorted(GROWTH_STAGES_BD)])
+    # settings тоже подменяются, чтобы fitness_fingerprint различал результаты с другими константами
+    for name in PARAMETER_GROUPS:
+        setattr(settings, name, parameters[name])
+
+
+#Временная подмена констант модели внутри блока with. Кэши условий сезона и фенологии на время
+#блока очищаются и затем восстанавливаются. Меняет глобальное состояние модуля - не для потоков.
+@contextlib.contextmanager
+def model_parameters(overrides=None, parameters=None):
+    previous = active_parameters()
+    saved_forcing = dict(_forcing_cache)
+    saved_phenology = dict(_phenology_cache)
+    _install_parameters(apply_parameter_overrides(overrides or {}, parameters))
+    _forcing_cache.clear()
+    _phenology_cache.clear()
+    try:
+        yield
+    finally:
+        _install_parameters(previous)
+        _forcing_cache.clear()
+        _forcing_cache.update(saved_forcing)
+        _phenology_cache.clear()
+        _phenology_cache.update(saved_phenology)
+
+def _resolve_forcing(days, temperatures, latitude, forcing):
+    if forcing is None:
+        if temperatures is None or latitude is None:
+            raise ValueError("either forcing or both temperatures and latitude must be given")
+        return get_forcing(latitude, temperatures, days)
+    if forcing.days < days:
+        raise ValueError(f"forcing covers {forcing.days} days, {days} requested")
+    return forcing
+
+#Поля дневной трассировки; первые семь совпадают с прежними кортежами results
+TRACE_DTYPE = np.dtype([
+    ('day', np.int16),
+    ('stage', np.int8),
+    ('height', np.float64),
+    ('leaves', np.int16),
+    ('buds', np.int16),
+    ('biomass', np.float64),
+    ('yield', np.float64),
+    ('cap', np.float64),
+    ('leaf', np.float64),
+    ('stem', np.float64),
+    ('grain', np.float64),
+])
+RESULT_FIELDS = ['day', 'stage', 'height', 'leaves', 'buds', 'biomass', 'yield']
+TRACE_MODES = ('none', 'summary', 'full')
+#Возможное число бутонов и цветков; Generator.choice тянет его так же, как integers(3, 6)
+BUD_COUNTS = (3, 4, 5)
+
+
+#Интерфейс numpy.random.Generator поверх модульных random и np.random: сохраняет прежнее поведение
+#calculate_yield, когда генератор не передан и воспроизводимость задается random.seed и np.random.seed
+class LegacyRandom:
+    def random(self):
+        return random.random()
+
+    def uniform(self, low, high):
+        return random.uniform(low, high)
+
+    def choice(self, options):
+        return random.choice(options)
+
+    # Целое из [low, high), как у np.random.Generator. В исходной модели единственное такое
+    # число (ветви) тянулось из np.random, а число бутонов и цветков - из random (см. choice)
+    def integers(self, low, high):
+        return np.random.randint(low, high)
+
+
+#Пошаговая модель одного растения. Состояние компактно (скаляры, органы со __slots__, пулы NumPy),
+#поэтому snapshot/fork дешевле deepcopy, а общий детерминированный префикс сезона можно
+#просчитать один раз и ветвить только стохастическую часть.
+class Simulation:
+    def __init__(self, days, grain_params, initial_biomass, traits, temperatures=None, latitude=None,
+                 forcing=None, trace='full', rng=None):
+        if trace not in TRACE_MODES:
+            raise ValueError(f"trace must be one of {TRACE_MODES}, got {trace!r}")
+        self.days = days
+        self.grain_params = grain_params
+        self.initial_biomass = initial_biomass
+        self.traits = tuple(traits)
+        self.trace_mode = trace
+        self.rng = rng if rng is not None else LegacyRandom()
+        self.forcing = _resolve_forcing(days, temperatures, latitude, forcing)
+        self.phenology = get_phenology(self.forcing, self.traits[3], days)
+
+        self.day = 0
+        self.stage = 1
+        self.CAP = 0
+        self.yield_total = 0
+        self.total_biomass = initial_biomass
+        self.transfer = None
+        self.organs = PlantOrgans(initial_biomass, [self.traits[1]] * 12)
+        # Силы стоков в порядке SINK_ORDER
+        self.sink_strength = [5.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+        self.trace = np.zeros(days, dtype=TRACE_DTYPE) if trace == 'full' else None
+
+    @property
+    def finished(self):
+        return self.day >= self.days
+
+    #Первый день, в который модель тянет случайные числа (стадия 2)
+    @property
+    def stochastic_start_day(self):
+        days = np.flatnonzero(self.phenology.stage >= 2)
+        return int(days[0]) + 1 if len(days) else self.days + 1
+
+    def step(self):
+        if self.finished:
+            raise RuntimeError("simulation already finished")
+
+        t = self.day + 1
+        organs = self.organs
+        seed, leaf, stem, grain = organs.seed, organs.leaf, organs.stem, organs.grain
+        buds, flowers, capsules = organs.buds, organs.flowers, grain.capsules
+        sink_strength = self.sink_strength
+        rng = self.rng
+        allocation_ratio = self.traits[0]
+        photosynthetic_efficiency = self.traits[2]
+
+        previous_stage = self.stage
+        current_stage = int(self.phenology.stage[t - 1])
+        sum_BD = float(self.phenology.sum_bd[t - 1])
+        growth_coeff = float(self.phenology.growth_coeff[t - 1])
+
+        E_dir = self.forcing.E_dir[t - 1]
+        E_dif = self.forcing.E_dif[t - 1]
 
         if current_stage == 1:
 
-            if organs['seed']['biomass'] > 0:
-                transfer = organs['seed']['biomass'] * 0.9
-                organs['seed']['biomass'] -= transfer
-                organs['leaf']['biomass'] = transfer * 0.7
-                organs['stem']['biomass'] = transfer * 0.3
-                organs['leaf']['count'] = 0
-                organs['leaf']['size'] = organs['leaf']['biomass'] * CONVERSION_FACTORS['leaf']
-                organs['stem']['diameter'] = 0.1
+            if seed.biomass > 0:
+                transfer = seed.biomass * 0.9
+                seed.biomass -= transfer
+                leaf.biomass = transfer * 0.7
+                stem.biomass = transfer * 0.3
+                leaf.count = 0
+                leaf.size = leaf.biomass * CONVERSION_FACTORS['leaf']
+                stem.diameter = 0.1
+                self.transfer = transfer
 
 
         elif current_stage == 2:
 
-            if random.random() < 0.5 and organs['leaf']['count'] < 85:
-                organs['leaf']['count'] = 12
-                organs['leaf']['angles'].append(random.uniform(0, 90))
-                organs['leaf']['biomass'] = transfer * allocation_ratio
-                organs['leaf']['size'] = organs['leaf']['biomass'] * CONVERSION_FACTORS['leaf']
-                organs['stem']['biomass'] = transfer * (1 - allocation_ratio)
-                organs['stem']['diameter'] += 0.02
-                organs['stem']['biomass'] += 0.2 * growth_coeff
-            sink_strength.update({'leaf': 15.0, 'stem': 10.0, 'seed': 0.0})
+            if rng.random() < 0.5 and leaf.count < 85:
+                leaf.count = 12
+                leaf.add_angle(rng.uniform(0, 90))
+                leaf.biomass = self.transfer * allocation_ratio
+                leaf.size = leaf.biomass * CONVERSION_FACTORS['leaf']
+                stem.biomass = self.transfer * (1 - allocation_ratio)
+                stem.diameter += 0.02
+                stem.biomass += 0.2 * growth_coeff
+            sink_strength[LEAF] = 15.0
+            sink_strength[STEM] = 10.0
+            sink_strength[SEED] = 0.0
 
 
         elif current_stage == 3:
 
-            organs['stem']['branches'] = np.random.randint(2, 5)
-            organs['buds'] = [{'biomass': 0.01, 'maturity': 0.0} for _ in range(5)]
-            sink_strength['buds'] = 8.0
-            organs['stem']['height'] += 1.2 * growth_coeff
-            organs['stem']['diameter'] += 0.03
+            stem.branches = int(rng.integers(2, 5))
+            buds.reset(5, biomass=0.01)
+            sink_strength[BUDS] = 8.0
+            stem.height += 1.2 * growth_coeff
+            stem.diameter += 0.03
 
 
         elif current_stage == 4:
 
-            if random.random() < 0.25 and organs['leaf']['count'] < 85:
-                organs['leaf']['count'] += 1
-                organs['leaf']['angles'].append(random.uniform(0, 90))
-                organs['leaf']['biomass'] += 0.2 * growth_coeff
+            if rng.random() < 0.25 and leaf.count < 85:
+                leaf.count += 1
+                leaf.add_angle(rng.uniform(0, 90))
+                leaf.biomass += 0.2 * growth_coeff
                 if sum_BD <= 36:
-                    organs['leaf']['scale'] = 1.2
+                    leaf.scale = 1.2
                 elif 36 < sum_BD <= 45:
-                    organs['leaf']['scale'] = 1.0
-                organs['leaf']['size'] = organs['leaf']['biomass'] * CONVERSION_FACTORS['leaf'] * organs['leaf']['scale']
-            sink_strength['leaf'] = 20.0
+                    leaf.scale = 1.0
+                leaf.size = leaf.biomass * CONVERSION_FACTORS['leaf'] * leaf.scale
+            sink_strength[LEAF] = 20.0
 
 
         elif current_stage == 5:
 
-            if not organs['buds']:
-                num_buds = random.randint(3, 5)
-                for bud in organs['buds']:
-                    bud['biomass'] += 0.01 * growth_coeff
-                organs['buds'] = [{'size': 0.1, 'biomass': 0.01, 'maturity': 0.0} for _ in range(num_buds)]
-            organs['stem']['diameter'] += 0.03
-            sink_strength['buds'] = 12.0
+            if not buds.count:
+                num_buds = int(rng.choice(BUD_COUNTS))
+                buds.reset(num_buds, size=0.1, biomass=0.01)
+            stem.diameter += 0.03
+            sink_strength[BUDS] = 12.0
 
 
         elif current_stage == 7:
 
-            if not organs['flowers']:
-                num_flowers = random.randint(3, 5)
-                organs['flowers'] = [{
-                    'size': 0.5,
-                    'biomass': 0.0,
-                    'pollinated': True,
-                    'maturity': 0.0
-                } for _ in range(num_flowers)]
-            for flower in organs['flowers']:
-                flower['biomass'] += 0.02 * growth_coeff
+            if not flowers.count:
+                num_flowers = int(rng.choice(BUD_COUNTS))
+                flowers.reset(num_flowers, size=0.5, biomass=0.0, pollinated=True)
+            flowers.biomass[:flowers.count] += 0.02 * growth_coeff
 
-            organs['leaf']['scale'] *= 0.8
-            sink_strength.update({'buds': 15.0, 'flowers': 5.0})
+            leaf.scale *= 0.8
+            sink_strength[BUDS] = 15.0
+            sink_strength[FLOWERS] = 5.0
 
 
         elif current_stage == 8:
 
-            for flower in organs['flowers']:
-                flower['size'] = min(1.0, flower['size'] + 0.05)
-                flower['biomass'] += 0.02 * growth_coeff
-            sink_strength['flowers'] = 20.0
+            n = flowers.count
+            np.minimum(1.0, flowers.size[:n] + 0.05, out=flowers.size[:n])
+            flowers.biomass[:n] += 0.02 * growth_coeff
+            sink_strength[FLOWERS] = 20.0
 
 
         elif current_stage == 9:
             if previous_stage != 9:
-                organs['grain']['capsules'] = [
-                    {
-                        'seeds': SEEDS_PER_CAPSULE if f['pollinated'] else 0,
-                        'size': 0.001,
-                        'biomass': 0.0001,
-                        'maturity': 0.0
-                    } for f in organs['flowers'] if f['pollinated']
-                ]
-                organs['flowers'] = []
-
-            for capsule in organs['grain']['capsules']:
-                capsule['biomass'] += 0.04 * growth_coeff
-                capsule['maturity'] += 0.35 * growth_coeff
-            sink_strength['grain'] = 25.0
-
-        elif current_stage == 10:
+                n_pollinated = int(flowers.pollinated[:flowers.count].sum())
+                capsules.reset(n_pollinated, seeds=SEEDS_PER_CAPSULE, size=0.001, biomass=0.0001)
+                flowers.clear()
 
-            for capsule in organs['grain']['capsules']:
-                capsule['size'] = min(1.0, capsule['size'] + 0.05 * growth_coeff)
-                capsule['biomass'] += 0.03 * growth_coeff
-                capsule['maturity'] += 0.25 * growth_coeff
-            sink_strength['grain'] = 30.0
+            n = capsules.count
+            capsules.biomass[:n] += 0.04 * growth_coeff
+            capsules.maturity[:n] += 0.35 * growth_coeff
+            sink_strength[GRAIN] = 25.0
 
-        elif current_stage == 11:
+        elif current_stage == 10:
 
-            yield_total = sum(
-                capsule['size'] * capsule['seeds'] * CONVERSION_FACTORS['grain']
-                for capsule in organs['grain']['capsules']
-                if capsule['maturity'] >= 1.0 or current_stage == 11
-            )
+            n = capsules.count
+            np.minimum(1.0, capsules.size[:n] + 0.05 * growth_coeff, out=capsules.size[:n])
+            capsules.biomass[:n] += 0.03 * growth_coeff
+            capsules.maturity[:n] += 0.25 * growth_coeff
+            sink_strength[GRAIN] = 30.0
 
-        leaf_area = organs['leaf']['size'] * organs['leaf']['count']
-        leaf_angle = organs['leaf']['angles']
+        leaf_area = leaf.size * leaf.count
 
-        absorbed_PAR = calculate_absorbed_PAR(leaf_area, leaf_angle, E_dir, E_dif)
+        absorbed_PAR = calculate_absorbed_PAR_running(leaf_area, leaf.sin_sum, leaf.angle_count, E_dir, E_dif)
         P_t = calculate_photosynthetic_production(absorbed_PAR, photosynthetic_efficiency)
-        C_mr = calculate_maintenance_respiration(total_biomass)
-        CAP = max(0, calculate_cap(CAP, P_t, C_mr))
+        C_mr = calculate_maintenance_respiration(self.total_biomass)
+        CAP = max(0, calculate_cap(self.CAP, P_t, C_mr))
 
-        active_sinks = {k: v for k, v in sink_strength.items() if v > 0}
-        S_total = sum(active_sinks.values())
+        S_total = 0.0
+        for S_o in sink_strength:
+            if S_o > 0:
+                S_total += S_o
 
-        allocations = {}
-        if S_total > 0:
-            for organ in active_sinks:
-                S_o = active_sinks[organ]
+        allocations = [0.0] * len(SINK_ORDER)
+        for organ, S_o in enumerate(sink_strength):
+            if S_o > 0:
                 G_o = calculate_biomass_increment(S_o, S_total, CAP)
                 allocations[organ] = G_o
                 CAP -= G_o
 
-        for organ in ['leaf', 'stem', 'grain', 'buds', 'flowers']:
-            if organ in allocations:
-                if organ == 'buds' and organs['buds']:
-                    allocation_per = allocations[organ] / len(organs['buds'])
-                    for bud in organs['buds']:
-                        bud['biomass'] += allocation_per
-                elif organ == 'flowers' and organs['flowers']:
-                    allocation_per = allocations[organ] / len(organs['flowers'])
-                    for flower in organs['flowers']:
-                        flower['biomass'] += allocation_per
-                else:
-                    if isinstance(organs.get(organ, {}), dict):
-                        organs[organ]['biomass'] += allocations.get(organ, 0)
-
-        organs['leaf']['size'] = organs['leaf']['biomass'] * CONVERSION_FACTORS['leaf'] * organs['leaf']['scale']
-        organs['stem']['height'] = organs['stem']['biomass'] * CONVERSION_FACTORS['stem']
-        organs['stem']['diameter'] = max(0.1, organs['stem']['diameter'])
-
-        if t_grain_start <= t <= t_grain_end:
-            grain_alloc = allocations.get('grain', 0)
-            D_grain_values.append(grain_alloc)
-
-        yield_total = sum(
-            capsule['biomass'] * capsule['seeds'] * CONVERSION_FACTORS['grain']
-            for capsule in organs['grain']['capsules']
-            if capsule['maturity'] >= 0.9
+        leaf.biomass += allocations[LEAF]
+        stem.biomass += allocations[STEM]
+        grain.biomass += allocations[GRAIN]
+        if buds.count:
+            buds.biomass[:buds.count] += allocations[BUDS] / buds.count
+        if flowers.count:
+            flowers.biomass[:flowers.count] += allocations[FLOWERS] / flowers.count
+
+        leaf.size = leaf.biomass * CONVERSION_FACTORS['leaf'] * leaf.scale
+        stem.height = stem.biomass * CONVERSION_FACTORS['stem']
+        stem.diameter = max(0.1, stem.diameter)
+
+        n = capsules.count
+        mature = capsules.maturity[:n] >= 0.9
+        yield_total = float(np.dot(capsules.biomass[:n][mature], capsules.seeds[:n][mature])) * CONVERSION_FACTORS['grain']
+
+        total_biomass = organs.total_biomass()
+
+        if self.trace is not None:
+            self.trace[t - 1] = (
+                t,
+                current_stage,
+                round(stem.height, 1),
+                leaf.count,
+                buds.count,
+                total_biomass,
+                round(yield_total, 2),
+                CAP,
+                leaf.biomass,
+                stem.biomass,
+                grain.biomass
+            )
+
+        self.day = t
+        self.stage = current_stage
+        self.CAP = CAP
+        self.yield_total = yield_total
+        self.total_biomass = total_biomass
+        return current_stage
+
+    #Считает до конца дня day либо останавливается перед первым днем стадии stage
+    def run_until(self, day=None, stage=None):
+        if day is None and stage is None:
+            day = self.days
+        if day is not None:
+            while self.day < min(day, self.days):
+                self.step()
+        if stage is not None:
+            while not self.finished and self.phenology.stage[self.day] < stage:
+                self.step()
+        return self
+
+    def run(self):
+        self.run_until(day=self.days)
+        return self.result()
+
+    def result(self):
+        growth_time = self.phenology.growth_time
+
+        if self.trace_mode == 'none':
+            return self.yield_total, growth_time
+
+        if self.trace_mode == 'summary':
+            organs = self.organs
+            return {
+                'yield': self.yield_total,
+                'growth_time': growth_time,
+                'stage': self.stage,
+                'height': organs.stem.height,
+                'leaves': organs.leaf.count,
+                'buds': organs.buds.count,
+                'biomass': self.total_biomass,
+                'cap': self.CAP,
+            }
+
+        trace = self.trace
+        return (self.yield_total, trace[RESULT_FIELDS], growth_time, trace['cap'], trace['leaf'],
+                trace['stem'], trace['grain'])
+
+    def snapshot(self):
+        return {
+            'day': self.day,
+            'stage': self.stage,
+            'CAP': self.CAP,
+            'yield_total': self.yield_total,
+            'total_biomass': self.total_biomass,
+            'transfer': self.transfer,
+            'organs': self.organs.copy(),
+            'sink_strength': list(self.sink_strength),
+            'trace': self.trace[:self.day].copy() if self.trace is not None else None,
+        }
+
+    def restore(self, snapshot):
+        self.day = snapshot['day']
+        self.stage = snapshot['stage']
+        self.CAP = snapshot['CAP']
+        self.yield_total = snapshot['yield_total']
+        self.total_biomass = snapshot['total_biomass']
+        self.transfer = snapshot['transfer']
+        self.organs = snapshot['organs'].copy()
+        self.sink_strength = list(snapshot['sink_strength'])
+        if self.trace_mode == 'full':
+            self.trace = np.zeros(self.days, dtype=TRACE_DTYPE)
+            self.trace[:self.day] = snapshot['trace']
+        return self
+
+    #Независимая копия текущего состояния; условия сезона и фенология остаются общими.
+    #rng - генератор для ветки; без него ветка продолжает общий поток родителя.
+    def fork(self, rng=None):
+        simulation = Simulation.__new__(Simulation)
+        simulation.days = self.days
+        simulation.grain_params = self.grain_params
+        simulation.initial_biomass = self.initial_biomass
+        simulation.traits = self.traits
+        simulation.trace_mode = self.trace_mode
+        simulation.rng = rng if rng is not None else self.rng
+        simulation.forcing = self.forcing
+        simulation.phenology = self.phenology
+        simulation.trace = None
+        return simulation.restore(self.snapshot())
+
+    def save(self, path):
+        checkpoint = {
+            'days': self.days,
+            'grain_params': self.grain_params,
+            'initial_biomass': self.initial_biomass,
+            'traits': self.traits,
+            'trace': self.trace_mode,
+            'latitude': self.forcing.latitude,
+            'temperatures': self.forcing.temperature,
+            'state': self.snapshot(),
+            # Состояние генератора numpy; поток LegacyRandom живет в модуле random и не сохраняется
+            'rng': None if isinstance(self.rng, LegacyRandom) else {
+                'bit_generator': type(self.rng.bit_generator).__name__,
+                'state': self.rng.bit_generator.state,
+            },
+        }
+        with open(path, 'wb') as f:
+            pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            checkpoint = pickle.load(f)
+        rng = None
+        if checkpoint.get('rng') is not None:
+            bit_generator = getattr(np.random, checkpoint['rng']['bit_generator'])()
+            bit_generator.state = checkpoint['rng']['state']
+            rng = np.random.Generator(bit_generator)
+        simulation = cls(
+            days=checkpoint['days'],
+            grain_params=checkpoint['grain_params'],
+            initial_biomass=checkpoint['initial_biomass'],
+            traits=checkpoint['traits'],
+            temperatures=checkpoint['temperatures'],
+            latitude=checkpoint['latitude'],
+            trace=checkpoint['trace'],
+            rng=rng,
         )
+        return simulation.restore(checkpoint['state'])
+
+
+#trace='none'    -> (yield_total, growth_time)
+#trace='summary' -> словарь с итоговыми значениями на конец сезона
+#trace='full'    -> (yield_total, results, growth_time, cap_hist, leaf_hist, stem_hist, grain_hist),
+#                   где results - структурный массив TRACE_DTYPE по дням
+#rng - numpy.random.Generator; без него используется модульный random
+def calculate_yield(days, grain_params, initial_biomass, temperatures=None, latitude=None, traits=None, forcing=None,
+                    trace='full', rng=None):
+    return Simulation(days, grain_params, initial_biomass, traits, temperatures=temperatures, latitude=latitude,
+                      forcing=forcing, trace=trace, rng=rng).run()
+
+
+#Независимые генераторы случайных чисел для каждой строки популяции
+def spawn_row_generators(n, seed=None):
+    return [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(n)]
+
+
+def calculate_yield_batch(days, grain_params, initial_biomass, temperatures=None, latitude=None, traits_matrix=None,
+                          rngs=None, seed=None, return_history=False, forcing=None):
+    forcing = _resolve_forcing(days, temperatures, latitude, forcing)
+    traits_matrix = np.atleast_2d(np.asarray(traits_matrix, dtype=float))
+    n = traits_matrix.shape[0]
+    if rngs is None:
+        rngs = spawn_row_generators(n, seed)
+    if len(rngs) != n:
+        raise ValueError(f"expected {n} generators, got {len(rngs)}")
+
+    # Случайные решения каждой особи вытягиваются заранее из её собственного потока,
+    # поэтому результат строки не зависит от размера популяции
+    leaf_draws = np.empty((n, days))
+    angle_draws = np.empty((n, days))
+    bud_draws = np.empty(n, dtype=int)
+    flower_draws = np.empty(n, dtype=int)
+    branch_draws = np.empty(n, dtype=int)
+    for i, rng in enumerate(rngs):
+        leaf_draws[i] = rng.random(days)
+        angle_draws[i] = rng.uniform(0, 90, days)
+        bud_draws[i], flower_draws[i] = rng.integers(3, 6, size=2)
+        branch_draws[i] = rng.integers(2, 5)
+
+    allocation_ratio = traits_matrix[:, 0]
+    photosynthetic_efficiency = traits_matrix[:, 2]
+    temp_tolerance = traits_matrix[:, 3]
+
+    # Расписание стадий считается один раз на каждое уникальное значение термотолерантности
+    tolerances, tolerance_idx = np.unique(temp_tolerance, return_inverse=True)
+    schedules = [get_phenology(forcing, tol, days) for tol in tolerances]
+    stage_schedule = np.stack([p.stage for p in schedules], axis=1)[:, tolerance_idx]
+    sum_bd_schedule = np.stack([p.sum_bd for p in schedules], axis=1)[:, tolerance_idx]
+    growth_coeff_schedule = np.stack([p.growth_coeff for p in schedules], axis=1)[:, tolerance_idx]
+    growth_time = np.array([p.growth_time for p in schedules])[tolerance_idx]
+
+    CAP = np.zeros(n)
+    total_biomass = np.full(n, float(initial_biomass))
+    yield_total = np.zeros(n)
+    stage = np.ones(n, dtype=int)
+
+    sin_sum = 12 * np.sin(np.radians(traits_matrix[:, 1]))
+    n_angles = np.full(n, 12)
+
+    seed_b = np.full(n, float(initial_biomass))
+    transfer = np.zeros(n)
+    leaf_b = np.zeros(n)
+    leaf_size = np.zeros(n)
+    leaf_count = np.zeros(n, dtype=int)
+    leaf_scale = np.ones(n)
+    stem_b = np.zeros(n)
+    stem_height = np.zeros(n)
+    stem_diameter = np.zeros(n)
+    branches = np.zeros(n, dtype=int)
+    grain_b = np.zeros(n)
+
+    # Все бутоны (цветки, коробочки) одного растения создаются и растут синхронно,
+    # поэтому достаточно хранить их число и состояние одного органа
+    n_buds = np.zeros(n, dtype=int)
+    bud_b = np.zeros(n)
+    n_flowers = np.zeros(n, dtype=int)
+    flower_b = np.zeros(n)
+    flower_size = np.zeros(n)
+    n_capsules = np.zeros(n, dtype=int)
+    capsule_b = np.zeros(n)
+    capsule_size = np.zeros(n)
+    capsule_maturity = np.zeros(n)
+
+    sinks = np.zeros((n, len(SINK_ORDER)))
+    sinks[:, SEED] = 5.0
+
+    history = None
+    if return_history:
+        history = {key: np.zeros((days, n)) for key in
+                   ('stage', 'height', 'leaves', 'buds', 'biomass', 'yield', 'cap', 'leaf', 'stem', 'grain')}
 
-        total_biomass = sum([
-            organs['seed']['biomass'],
-            organs['leaf']['biomass'],
-            organs['stem']['biomass'],
-            organs['grain']['biomass'],
-            sum(bud['biomass'] for bud in organs['buds']),
-            sum(flower['biomass'] for flower in organs['flowers'])
-        ])
-
-        results.append((
-            t,
-            current_stage,
-            round(organs['stem']['height'], 1),
-            organs['leaf']['count'],
-            len(organs['buds']),
-            total_biomass,
-            round(yield_total, 2)
-        ))
-
-        growth_time = days
-        for day_data in results:
-            if day_data[1] == 11:
-                growth_time = day_data[0]
-                break
-
-    return yield_total, results, growth_time
\ No newline at end of file
+    for t in range(1, days + 1):
+        previous_stage = stage
+
+        E_dir = forcing.E_dir[t - 1]
+        E_dif = forcing.E_dif[t - 1]
+
+        stage = stage_schedule[t - 1]
+        sum_BD = sum_bd_schedule[t - 1]
+        growth_coeff = growth_coeff_schedule[t - 1]
+
+        s1 = (stage == 1) & (seed_b > 0)
+        if s1.any():
+            transfer = np.where(s1, seed_b * 0.9, transfer)
+            seed_b = np.where(s1, seed_b - transfer, seed_b)
+            leaf_b = np.where(s1, transfer * 0.7, leaf_b)
+            stem_b = np.where(s1, transfer * 0.3, stem_b)
+            leaf_count = np.where(s1, 0, leaf_count)
+            leaf_size = np.where(s1, leaf_b * CONVERSION_FACTORS['leaf'], leaf_size)
+            stem_diameter = np.where(s1, 0.1, stem_diameter)
+
+        s2 = stage == 2
+        if s2.any():
+            grow = s2 & (leaf_draws[:, t - 1] < 0.5) & (leaf_count < 85)
+            leaf_count = np.where(grow, 12, leaf_count)
+            sin_sum = sin_sum + np.where(grow, np.sin(np.radians(angle_draws[:, t - 1])), 0.0)
+            n_angles = n_angles + grow
+            leaf_b = np.where(grow, transfer * allocation_ratio, leaf_b)
+            leaf_size = np.where(grow, leaf_b * CONVERSION_FACTORS['leaf'], leaf_size)
+            stem_b = np.where(grow, transfer * (1 - allocation_ratio) + 0.2 * growth_coeff, stem_b)
+            stem_diameter = stem_diameter + np.where(grow, 0.02, 0.0)
+            sinks[s2, LEAF] = 15.0
+            sinks[s2, STEM] = 10.0
+            sinks[s2, SEED] = 0.0
+
+        s3 = stage == 3
+        if s3.any():
+            branches = np.where(s3, branch_draws, branches)
+            n_buds = np.where(s3, 5, n_buds)
+            bud_b = np.where(s3, 0.01, bud_b)
+            sinks[s3, BUDS] = 8.0
+            stem_diameter = stem_diameter + np.where(s3, 0.03, 0.0)
+
+        s4 = stage == 4
+        if s4.any():
+            grow = s4 & (leaf_draws[:, t - 1] < 0.25) & (leaf_count < 85)
+            leaf_count = leaf_count + grow
+            sin_sum = sin_sum + np.where(grow, np.sin(np.radians(angle_draws[:, t - 1])), 0.0)
+            n_angles = n_angles + grow
+            leaf_b = leaf_b + np.where(grow, 0.2 * growth_coeff, 0.0)
+            leaf_scale = np.where(grow & (sum_BD <= 36), 1.2, leaf_scale)
+            leaf_scale = np.where(grow & (sum_BD > 36) & (sum_BD <= 45), 1.0, leaf_scale)
+            leaf_size = np.where(grow, leaf_b * CONVERSION_FACTORS['leaf'] * leaf_scale, leaf_size)
+            sinks[s4, LEAF] = 20.0
+
+        s5 = stage == 5
+        if s5.any():
+            new_buds = s5 & (n_buds == 0)
+            n_buds = np.where(new_buds, bud_draws, n_buds)
+            bud_b = np.where(new_buds, 0.01, bud_b)
+            stem_diameter = stem_diameter + np.where(s5, 0.03, 0.0)
+            sinks[s5, BUDS] = 12.0
+
+        s7 = stage == 7
+        if s7.any():
+            new_flowers = s7 & (n_flowers == 0)
+            n_flowers = np.where(new_flowers, flower_draws, n_flowers)
+            flower_size = np.where(new_flowers, 0.5, flower_size)
+            flower_b = np.where(new_flowers, 0.0, flower_b)
+            flower_b = flower_b + np.where(s7, 0.02 * growth_coeff, 0.0)
+            leaf_scale = np.where(s7, leaf_scale * 0.8, leaf_scale)
+            sinks[s7, BUDS] = 15.0
+            sinks[s7, FLOWERS] = 5.0
+
+        s8 = stage == 8
+        if s8.any():
+            flower_size = np.where(s8, np.minimum(1.0, flower_size + 0.05), flower_size)
+            flower_b = flower_b + np.where(s8, 0.02 * growth_coeff, 0.0)
+            sinks[s8, FLOWERS] = 20.0
+
+        s9 = stage == 9
+        if s9.any():
+            new_capsules = s9 & (previous_stage != 9)
+            n_capsules = np.where(new_capsules, n_flowers, n_capsules)
+            capsule_size = np.where(new_capsules, 0.001, capsule_size)
+            capsule_b = np.where(new_capsules, 0.0001, capsule_b)
+            capsule_maturity = np.where(new_capsules, 0.0, capsule_maturity)
+            n_flowers = np.where(new_capsules, 0, n_flowers)
+            capsule_b = capsule_b + np.where(s9, 0.04 * growth_coeff, 0.0)
+            capsule_maturity = capsule_maturity + np.where(s9, 0.35 * growth_coeff, 0.0)
+            sinks[s9, GRAIN] = 25.0
+
+        s10 = stage == 10
+        if s10.any():
+            capsule_size = np.where(s10, np.minimum(1.0, capsule_size + 0.05 * growth_coeff), capsule_size)
+            capsule_b = capsule_b + np.where(s10, 0.03 * growth_coeff, 0.0)
+            capsule_maturity = capsule_maturity + np.where(s10, 0.25 * growth_coeff, 0.0)
+            sinks[s10, GRAIN] = 30.0
+
+        leaf_area = leaf_size * leaf_count
+        absorbed_PAR = calculate_absorbed_PAR_batch_running(leaf_area, sin_sum, n_angles, E_dir, E_dif)
+        P_t = np.where(absorbed_PAR > 0, np.minimum(absorbed_PAR * photosynthetic_efficiency, 12.1), 0.0)
+        C_mr = calculate_maintenance_respiration(total_biomass)
+        CAP = np.maximum(0, CAP + P_t - C_mr)
+
+        active = sinks > 0
+        S_total = np.where(active, sinks, 0.0).sum(axis=1)
+        safe_total = np.where(S_total > 0, S_total, 1.0)
+        allocations = np.zeros_like(sinks)
+        for organ in range(len(SINK_ORDER)):
+            S_o = sinks[:, organ]
+            G_o = np.where(active[:, organ], np.minimum(S_o, (S_o / safe_total) * CAP), 0.0)
+            allocations[:, organ] = G_o
+            CAP = CAP - G_o
+
+        leaf_b = leaf_b + allocations[:, LEAF]
+        stem_b = stem_b + allocations[:, STEM]
+        grain_b = grain_b + allocations[:, GRAIN]
+        bud_b = bud_b + np.where(n_buds > 0, allocations[:, BUDS] / np.maximum(n_buds, 1), 0.0)
+        flower_b = flower_b + np.where(n_flowers > 0, allocations[:, FLOWERS] / np.maximum(n_flowers, 1), 0.0)
+
+        leaf_size = leaf_b * CONVERSION_FACTORS['leaf'] * leaf_scale
+        stem_height = stem_b * CONVERSION_FACTORS['stem']
+        stem_diameter = np.maximum(0.1, stem_diameter)
+
+        yield_total = np.where(capsule_maturity >= 0.9,
+                               capsule_b * SEEDS_PER_CAPSULE * CONVERSION_FACTORS['grain'] * n_capsules, 0.0)
+
+        total_biomass = (seed_b + leaf_b + stem_b + grain_b + n_buds * bud_b + n_flowers * flower_b)
+
+        if history is not None:
+            history['stage'][t - 1] = stage
+            history['height'][t - 1] = stem_height
+            history['leaves'][t - 1] = leaf_count
+            history['buds'][t - 1] = n_buds
+            history['biomass'][t - 1] = total_biomass
+            history['yield'][t - 1] = yield_total
+            history['cap'][t - 1] = CAP
+            history['leaf'][t - 1] = leaf_b
+            history['stem'][t - 1] = stem_b
+            history['grain'][t - 1] = grain_b
+
+    if return_history:
+        return yield_total, growth_time, history
+    return yield_total, growth_time
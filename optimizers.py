@@ -0,0 +1,258 @@
+import math
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+from evaluation import FitnessEvaluator
+from ga import evaluate_traits_matrix
+from settings import ITERATIONS
+from stopping import StoppingRules, stop_report
+
+
+#Целевая функция в ящике признаков ranges (PARAM_RANGES наборов): строки X прижимаются к границам
+#и округляются до сотых, как признаки декодера, поэтому кэш и хранилище приспособленности общие с ГА
+class TraitObjective:
+    def __init__(self, evaluator: FitnessEvaluator, ranges):
+        self.owns_evaluator = evaluator is None
+        self.evaluator = evaluator if evaluator is not None else FitnessEvaluator()
+        self.low = np.array([r[0] for r in ranges], dtype=float)
+        self.high = np.array([r[1] for r in ranges], dtype=float)
+
+    def traits(self, X):
+        return np.round(np.clip(np.atleast_2d(X), self.low, self.high), 2)
+
+    def __call__(self, X):
+        return evaluate_traits_matrix(self.traits(X), self.evaluator)
+
+    def close(self):
+        if self.owns_evaluator:
+            self.evaluator.close()
+
+
+#Целевая функция в пространстве значений SNP декодируемых локусов plant_cls:
+#координата - значение SNP локуса, при оценке округляется до целого из 0..max_value
+class SnpObjective(TraitObjective):
+    def __init__(self, configs, plant_cls, n_loci, evaluator: FitnessEvaluator = None):
+        plant_cls.set_configs(configs)
+        self.plant_cls = plant_cls
+        self.decoder = plant_cls.get_decoder()
+        self.n_loci = max(n_loci, self.decoder.n_loci)
+        super().__init__(evaluator, [(0, plant_cls.encoding.max_value)] * len(self.decoder.loci))
+
+    def values(self, X):
+        return np.rint(np.clip(np.atleast_2d(X), self.low, self.high)).astype(np.int8)
+
+    def traits(self, X):
+        return self.decoder.traits_from_raw(self.decoder.scores_from_values(self.values(X)))
+
+    #Растение с генотипом точки x; локусы вне декодера нулевые
+    def plant(self, x):
+        encoding = self.plant_cls.encoding
+        genome = np.zeros((self.n_loci, encoding.bits_per_locus), dtype=np.uint8)
+        genome[self.decoder.loci] = encoding.encode(self.values(x)[0])
+        return self.plant_cls(genome.reshape(-1))
+
+
+#Интерфейс оптимизаторов ask/tell с максимизацией: ask() - матрица кандидатов, tell() - их приспособленность.
+#Поиск идет в единичном кубе, кандидаты возвращаются в координатах ящика low..high.
+class ContinuousOptimizer(ABC):
+    def __init__(self, low, high, seed=None):
+        self.low = np.asarray(low, dtype=float)
+        self.high = np.asarray(high, dtype=float)
+        self.dim = len(self.low)
+        self.rng = np.random.default_rng(seed)
+        self.best_x = None
+        self.best_fitness = -np.inf
+
+    def _to_box(self, unit):
+        return self.low + np.clip(unit, 0, 1) * (self.high - self.low)
+
+    def _to_unit(self, X):
+        return (np.asarray(X, dtype=float) - self.low) / (self.high - self.low)
+
+    @abstractmethod
+    def ask(self):
+        pass
+
+    def tell(self, X, fitness):
+        best = int(np.argmax(fitness))
+        if fitness[best] > self.best_fitness:
+            self.best_fitness = float(fitness[best])
+            self.best_x = np.array(X[best], dtype=float)
+
+    #Разброс поиска (0..1 в долях ящика) для истории разнообразия
+    @property
+    @abstractmethod
+    def spread(self):
+        pass
+
+
+#CMA-ES (mu/mu_w, lambda) с полной ковариационной матрицей, по Hansen "The CMA Evolution Strategy: A Tutorial".
+#Выход за границы ящика исправляется проекцией, обновление идет по исправленным точкам.
+class CMAES(ContinuousOptimizer):
+    def __init__(self, low, high, seed=None, population_size=None, sigma=0.3, mean=None):
+        super().__init__(low, high, seed)
+        n = self.dim
+        self.population_size = population_size or 4 + int(3 * math.log(n))
+        self.mu = self.population_size // 2
+        weights = math.log(self.mu + 0.5) - np.log(np.arange(1, self.mu + 1))
+        self.weights = weights / weights.sum()
+        self.mueff = 1.0 / np.sum(self.weights ** 2)
+
+        self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + self.mueff)
+        self.cmu = min(1 - self.c1, 2 * (self.mueff - 2 + 1 / self.mueff) / ((n + 2) ** 2 + self.mueff))
+        self.damps = 1 + 2 * max(0.0, math.sqrt((self.mueff - 1) / (n + 1)) - 1) + self.cs
+        self.chi_n = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+        self.mean = self._to_unit(mean) if mean is not None else self.rng.uniform(0, 1, n)
+        self.sigma = sigma
+        self.C = np.eye(n)
+        self.B = np.eye(n)
+        self.D = np.ones(n)
+        self.pc = np.zeros(n)
+        self.ps = np.zeros(n)
+        self.generation = 0
+
+    def ask(self):
+        z = self.rng.standard_normal((self.population_size, self.dim))
+        unit = self.mean + self.sigma * (z * self.D) @ self.B.T
+        return self._to_box(unit)
+
+    def tell(self, X, fitness):
+        super().tell(X, fitness)
+        fitness = np.asarray(fitness, dtype=float)
+        order = np.argsort(-fitness, kind='stable')[:self.mu]
+        y = (self._to_unit(X)[order] - self.mean) / self.sigma
+        y_w = self.weights @ y
+        self.mean = self.mean + self.sigma * y_w
+
+        inv_sqrt_C = self.B @ np.diag(1 / self.D) @ self.B.T
+        self.ps = (1 - self.cs) * self.ps + math.sqrt(self.cs * (2 - self.cs) * self.mueff) * inv_sqrt_C @ y_w
+        self.generation += 1
+        norm_ps = np.linalg.norm(self.ps)
+        hsig = norm_ps / math.sqrt(1 - (1 - self.cs) ** (2 * self.generation)) / self.chi_n < 1.4 + 2 / (self.dim + 1)
+        self.pc = (1 - self.cc) * self.pc + hsig * math.sqrt(self.cc * (2 - self.cc) * self.mueff) * y_w
+
+        rank_mu = (y.T * self.weights) @ y
+        self.C = ((1 - self.c1 - self.cmu) * self.C
+                  + self.c1 * (np.outer(self.pc, self.pc) + (1 - hsig) * self.cc * (2 - self.cc) * self.C)
+                  + self.cmu * rank_mu)
+        self.sigma *= math.exp((self.cs / self.damps) * (norm_ps / self.chi_n - 1))
+
+        self.C = (self.C + self.C.T) / 2
+        eigenvalues, self.B = np.linalg.eigh(self.C)
+        self.D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+
+    @property
+    def spread(self):
+        return float(self.sigma * self.D.max())
+
+
+#Дифференциальная эволюция DE/rand/1/bin: первый ask() - случайная начальная популяция,
+#дальше - пробные векторы, каждый заменяет своего родителя, если не хуже его
+class DifferentialEvolution(ContinuousOptimizer):
+    def __init__(self, low, high, seed=None, population_size=None, F=0.7, CR=0.9):
+        super().__init__(low, high, seed)
+        self.population_size = population_size or max(8, min(10 * self.dim, 40))
+        self.F = F
+        self.CR = CR
+        self.population = None
+        self.fitness = None
+
+    def ask(self):
+        n = self.population_size
+        if self.population is None:
+            return self._to_box(self.rng.uniform(0, 1, (n, self.dim)))
+
+        # Три различных донора, не совпадающих с родителем: сдвиги 1..n-1 по кругу
+        donors = (np.arange(n)[:, np.newaxis] + 1 + np.argsort(self.rng.random((n, n - 1)), axis=1)[:, :3]) % n
+        a, b, c = (self.population[donors[:, i]] for i in range(3))
+        mutant = np.clip(a + self.F * (b - c), 0, 1)
+        cross = self.rng.random((n, self.dim)) < self.CR
+        cross[np.arange(n), self.rng.integers(0, self.dim, n)] = True
+        return self._to_box(np.where(cross, mutant, self.population))
+
+    def tell(self, X, fitness):
+        super().tell(X, fitness)
+        unit = self._to_unit(X)
+        fitness = np.asarray(fitness, dtype=float)
+        if self.population is None:
+            self.population, self.fitness = unit, fitness
+            return
+        better = fitness >= self.fitness
+        self.population[better] = unit[better]
+        self.fitness[better] = fitness[better]
+
+    @property
+    def spread(self):
+        return float(self.population.std(axis=0).max()) if self.population is not None else 1.0
+
+
+OPTIMIZERS = {'cmaes': CMAES, 'de': DifferentialEvolution}
+
+
+def make_optimizer(method, low, high, seed=None, **options) -> ContinuousOptimizer:
+    if method not in OPTIMIZERS:
+        raise ValueError(f"method must be one of {tuple(OPTIMIZERS)}, got {method!r}")
+    return OPTIMIZERS[method](low, high, seed, **options)
+
+
+#Прогоняет оптимизатор method ('cmaes', 'de' или экземпляр ContinuousOptimizer) на objective до generations
+#поколений или до правила stopping (StoppingRules; разнообразие - разброс поиска в долях ящика).
+#В stats пишется то же, что у genetic_algorithm_optimized: причина остановки и число моделирований.
+#Возвращает (лучшая точка, лучшая приспособленность, fitness_history).
+def optimize(objective, method='cmaes', generations=ITERATIONS, stopping: StoppingRules = None, seed=None,
+             stats: dict = None, **options):
+    optimizer = method if isinstance(method, ContinuousOptimizer) else make_optimizer(
+        method, objective.low, objective.high, seed, **options)
+    simulations_start = objective.evaluator.evaluations
+    fitness_history = []
+    requests = 0
+    reason = 'iterations'
+    if stopping is not None:
+        stopping.start()
+
+    generation = 0
+    for generation in range(generations):
+        X = optimizer.ask()
+        optimizer.tell(X, objective(X))
+        requests += len(X)
+        fitness_history.append(optimizer.best_fitness)
+        if stopping is not None:
+            stop = stopping.check(generation, optimizer.best_fitness, optimizer.spread,
+                                  objective.evaluator.evaluations - simulations_start)
+            if stop is not None:
+                reason = stop
+                break
+
+    if stats is not None:
+        stats.update(stop_report(reason, generation + 1, generations, requests, optimizer.population_size,
+                                 objective.evaluator.evaluations - simulations_start))
+    return optimizer.best_x, optimizer.best_fitness, fitness_history
+
+
+#Непрерывный оптимизатор method ('cmaes' или 'de') прямо в ящике признаков ranges.
+#Возвращает (лучшие признаки, их урожай, fitness_history).
+def optimize_traits(ranges, method='cmaes', evaluator: FitnessEvaluator = None, stopping: StoppingRules = None,
+                    stats: dict = None, seed=None, generations=ITERATIONS, **options):
+    objective = TraitObjective(evaluator, ranges)
+    try:
+        best, fitness, fitness_history = optimize(objective, method, generations, stopping, seed, stats, **options)
+    finally:
+        objective.close()
+    return objective.traits(best)[0].tolist(), fitness, fitness_history
+
+
+#Непрерывный оптимизатор в пространстве значений SNP декодируемых локусов растений plant_cls.
+#Возвращает (лучшее растение, fitness_history).
+def optimize_snp_effects(configs, plant_cls, n_loci, method='cmaes', evaluator: FitnessEvaluator = None,
+                         stopping: StoppingRules = None, stats: dict = None, seed=None, generations=ITERATIONS,
+                         **options):
+    objective = SnpObjective(configs, plant_cls, n_loci, evaluator)
+    try:
+        best, _, fitness_history = optimize(objective, method, generations, stopping, seed, stats, **options)
+    finally:
+        objective.close()
+    return objective.plant(best), fitness_history
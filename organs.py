@@ -0,0 +1,156 @@
+import math
+
+import numpy as np
+
+
+class Seed:
+    __slots__ = ('biomass', 'size')
+
+    def __init__(self, biomass=0.0, size=0.0):
+        self.biomass = biomass
+        self.size = size
+
+    def copy(self):
+        other = Seed.__new__(Seed)
+        other.biomass = self.biomass
+        other.size = self.size
+        return other
+
+
+class Leaf:
+    __slots__ = ('biomass', 'size', 'count', 'scale', 'angle_count', 'sin_sum')
+
+    def __init__(self, angles=(), biomass=0.0, size=0.0, count=0, scale=1.0):
+        self.biomass = biomass
+        self.size = size
+        self.count = count
+        self.scale = scale
+        # Вместо списка углов хранится их число и сумма синусов: этого достаточно для расчета PAR
+        self.angle_count = 0
+        self.sin_sum = 0.0
+        for angle in angles:
+            self.add_angle(angle)
+
+    def add_angle(self, angle):
+        self.angle_count += 1
+        self.sin_sum += math.sin(math.radians(angle))
+
+    def copy(self):
+        other = Leaf.__new__(Leaf)
+        other.biomass = self.biomass
+        other.size = self.size
+        other.count = self.count
+        other.scale = self.scale
+        other.angle_count = self.angle_count
+        other.sin_sum = self.sin_sum
+        return other
+
+
+class Stem:
+    __slots__ = ('biomass', 'height', 'branches', 'diameter')
+
+    def __init__(self, biomass=0.0, height=0.0, branches=0, diameter=0.0):
+        self.biomass = biomass
+        self.height = height
+        self.branches = branches
+        self.diameter = diameter
+
+    def copy(self):
+        other = Stem.__new__(Stem)
+        other.biomass = self.biomass
+        other.height = self.height
+        other.branches = self.branches
+        other.diameter = self.diameter
+        return other
+
+
+class Grain:
+    __slots__ = ('biomass', 'capsules')
+
+    def __init__(self, biomass=0.0, capsules=None):
+        self.biomass = biomass
+        self.capsules = capsules if capsules is not None else OrganPool()
+
+    def copy(self):
+        other = Grain.__new__(Grain)
+        other.biomass = self.biomass
+        other.capsules = self.capsules.copy()
+        return other
+
+
+#Пул однотипных органов (бутоны, цветки, коробочки) в виде массивов NumPy.
+#Активны первые count элементов, память переиспользуется между сбросами пула.
+class OrganPool:
+    __slots__ = ('count', 'biomass', 'size', 'maturity', 'seeds', 'pollinated')
+
+    def __init__(self, capacity=8):
+        self.count = 0
+        self.biomass = np.zeros(capacity)
+        self.size = np.zeros(capacity)
+        self.maturity = np.zeros(capacity)
+        self.seeds = np.zeros(capacity, dtype=int)
+        self.pollinated = np.zeros(capacity, dtype=bool)
+
+    def __len__(self):
+        return self.count
+
+    def _ensure_capacity(self, count):
+        capacity = len(self.biomass)
+        if count <= capacity:
+            return
+        capacity = max(count, 2 * capacity)
+        for field in ('biomass', 'size', 'maturity', 'seeds', 'pollinated'):
+            old = getattr(self, field)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, field, new)
+
+    def reset(self, count, biomass=0.0, size=0.0, maturity=0.0, seeds=0, pollinated=False):
+        self._ensure_capacity(count)
+        self.count = count
+        self.biomass[:count] = biomass
+        self.size[:count] = size
+        self.maturity[:count] = maturity
+        self.seeds[:count] = seeds
+        self.pollinated[:count] = pollinated
+
+    def clear(self):
+        self.count = 0
+
+    def total_biomass(self):
+        return float(self.biomass[:self.count].sum())
+
+    def copy(self):
+        pool = OrganPool.__new__(OrganPool)
+        pool.count = self.count
+        for field in ('biomass', 'size', 'maturity', 'seeds', 'pollinated'):
+            setattr(pool, field, getattr(self, field).copy())
+        return pool
+
+
+class PlantOrgans:
+    __slots__ = ('seed', 'leaf', 'stem', 'grain', 'buds', 'flowers', 'fruits')
+
+    def __init__(self, initial_biomass, leaf_angles):
+        self.seed = Seed(biomass=initial_biomass)
+        self.leaf = Leaf(angles=leaf_angles)
+        self.stem = Stem()
+        self.grain = Grain()
+        self.buds = OrganPool()
+        self.flowers = OrganPool()
+        self.fruits = OrganPool()
+
+    def total_biomass(self):
+        return (self.seed.biomass + self.leaf.biomass + self.stem.biomass + self.grain.biomass
+                + self.buds.total_biomass() + self.flowers.total_biomass())
+
+    def copy(self):
+        other = PlantOrgans.__new__(PlantOrgans)
+        other.seed = self.seed.copy()
+        other.leaf = self.leaf.copy()
+        other.stem = self.stem.copy()
+        other.grain = self.grain.copy()
+        other.buds = self.buds.copy()
+        other.flowers = self.flowers.copy()
+        other.fruits = self.fruits.copy()
+        return other
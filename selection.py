@@ -0,0 +1,66 @@
+import numpy as np
+
+from genome import _integers, _uniform
+
+SELECTION_METHODS = ('truncation', 'tournament', 'sus')
+
+
+#Индексы k лучших особей за O(n) через np.argpartition, упорядоченные по убыванию приспособленности.
+#При равенстве выигрывает меньший индекс - как в np.argsort(-fitness, kind='stable')[:k].
+def truncation(fitness, k):
+    fitness = np.asarray(fitness)
+    n = len(fitness)
+    k = min(k, n)
+    if k <= 0:
+        return np.zeros(0, dtype=np.intp)
+    if k < n:
+        threshold = fitness[np.argpartition(-fitness, k - 1)[k - 1]]
+        above = np.flatnonzero(fitness > threshold)
+        tied = np.flatnonzero(fitness == threshold)[:k - len(above)]
+        chosen = np.concatenate([above, tied])
+    else:
+        chosen = np.arange(n)
+    return chosen[np.lexsort((chosen, -fitness[chosen]))]
+
+
+#k-турнир для n победителей сразу: матрица участников (n x k) и argmax по строкам
+def tournament(fitness, n, k=3, rng=None):
+    fitness = np.asarray(fitness)
+    contestants = _integers(rng, 0, len(fitness), (n, k))
+    winners = np.argmax(fitness[contestants], axis=1)
+    return contestants[np.arange(n), winners]
+
+
+#Стохастическая универсальная выборка: n равноотстоящих указателей по накопленной приспособленности.
+#Отрицательная приспособленность сдвигается к нулю; при нулевой сумме выбор равномерный.
+def stochastic_universal_sampling(fitness, n, rng=None):
+    fitness = np.asarray(fitness, dtype=float)
+    weights = fitness - min(fitness.min(), 0.0)
+    total = weights.sum()
+    if total <= 0:
+        weights = np.ones(len(fitness))
+        total = float(len(fitness))
+    step = total / n
+    pointers = _uniform(rng, 1)[0] * step + step * np.arange(n)
+    return np.minimum(np.searchsorted(np.cumsum(weights), pointers, side='right'), len(fitness) - 1)
+
+
+#Пары родителей (parents_a, parents_b) для n потомков.
+#truncation: равномерно из pool_size лучших (ranked - уже упорядоченные индексы truncation),
+#tournament и sus: из всей популяции.
+def select_parents(fitness, n, method='truncation', pool_size=None, ranked=None, tournament_size=3, rng=None):
+    if method == 'truncation':
+        pool = ranked[:pool_size] if ranked is not None else truncation(fitness, pool_size)
+        parents_a = pool[_integers(rng, 0, len(pool), n)]
+        parents_b = pool[_integers(rng, 0, len(pool), n)]
+    elif method == 'tournament':
+        parents_a = tournament(fitness, n, tournament_size, rng)
+        parents_b = tournament(fitness, n, tournament_size, rng)
+    elif method == 'sus':
+        selected = stochastic_universal_sampling(fitness, 2 * n, rng)
+        # Указатели SUS идут по порядку особей, перемешиваем, чтобы пары не были соседями
+        selected = selected[np.argsort(_uniform(rng, 2 * n))]
+        parents_a, parents_b = selected[:n], selected[n:]
+    else:
+        raise ValueError(f"method must be one of {SELECTION_METHODS}, got {method!r}")
+    return parents_a, parents_b
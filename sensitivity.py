@@ -0,0 +1,412 @@
+import contextlib
+import csv
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from evaluation import make_config
+from model import calculate_yield_batch, default_parameters, get_parameter, get_forcing, model_parameters
+from population import PARAM_RANGES
+from settings import DAYS, FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION, SEED_MASS, temperatures
+
+TRAIT_NAMES = ('allocation_ratio', 'leaf_angle', 'photosynthetic_efficiency', 'temp_tolerance')
+OUTPUTS = ('yield', 'growth_time')
+
+# Направляющие числа Джо-Куо (new-joe-kuo-6.21201) для измерений 2..21
+_SOBOL_M = [
+    [1], [1, 3], [1, 3, 1], [1, 1, 1], [1, 1, 3, 3], [1, 3, 5, 13], [1, 1, 5, 5, 17], [1, 1, 5, 5, 5],
+    [1, 1, 7, 11, 19], [1, 1, 5, 1, 1], [1, 1, 1, 3, 11], [1, 3, 5, 5, 31], [1, 3, 3, 9, 7, 49],
+    [1, 1, 1, 15, 21, 21], [1, 3, 1, 13, 27, 49], [1, 1, 1, 15, 7, 5], [1, 3, 1, 15, 13, 25],
+    [1, 1, 5, 5, 19, 61], [1, 3, 7, 11, 23, 15, 103], [1, 3, 7, 13, 13, 15, 69],
+]
+_SOBOL_BITS = 32
+
+
+#Факторы - список (имя, нижняя граница, верхняя граница). Имена признаков из TRAIT_NAMES,
+#остальные - имена констант модели в форме model.apply_parameter_overrides.
+def trait_factors():
+    return [(name, low, high) for name, (low, high) in zip(TRAIT_NAMES, PARAM_RANGES)]
+
+
+#Константы модели с диапазоном +-spread от значения в settings.
+#Диапазон порога стадии GROWTH_STAGES_BD.k сужается до threshold_limits(k).
+def parameter_factors(names, spread=0.2):
+    factors = []
+    for name in names:
+        value = get_parameter(name)
+        low, high = sorted((value * (1 - spread), value * (1 + spread)))
+        if name.startswith('GROWTH_STAGES_BD.'):
+            limit_low, limit_high = threshold_limits(int(name.split('.')[1]))
+            low, high = max(low, limit_low), min(high, limit_high)
+        factors.append((name, low, high))
+    validate_factors(factors)
+    return factors
+
+
+#Допустимый диапазон верхнего порога стадии: от середины между ним и порогом предыдущей стадии
+#до середины между ним и порогом следующей. Пороги в таких диапазонах возрастают при любом сочетании.
+def threshold_limits(stage):
+    bounds = default_parameters()['GROWTH_STAGES_BD']
+    if stage not in bounds or not np.isfinite(bounds[stage][1]):
+        raise ValueError(f"stage {stage} has no finite growth threshold")
+    end = bounds[stage][1]
+    previous = bounds[stage - 1][1] if stage - 1 in bounds else bounds[stage][0]
+    following = bounds[stage + 1][1] if stage + 1 in bounds else np.inf
+    # Отступ 0.001 с каждой стороны: начало стадии лежит на 0.001 выше порога предыдущей
+    return (previous + end) / 2 + 0.001, (end + following) / 2 - 0.001 if np.isfinite(following) else np.inf
+
+
+#Проверка факторов до построения схемы: известные имена, low < high, и пороги стадий
+#GROWTH_STAGES_BD, которые при любых значениях из своих диапазонов остаются возрастающими
+def validate_factors(factors):
+    bounds = default_parameters()['GROWTH_STAGES_BD']
+    intervals = {stage: (end, end) for stage, (_, end) in bounds.items()}
+    for name, low, high in factors:
+        if not low < high:
+            raise ValueError(f"factor {name!r} needs low < high, got ({low}, {high})")
+        if name in TRAIT_NAMES:
+            continue
+        get_parameter(name)
+        if name.startswith('GROWTH_STAGES_BD.'):
+            stage = int(name.split('.')[1])
+            if not np.isfinite(bounds[stage][1]):
+                raise ValueError(f"stage {stage} has no finite growth threshold")
+            intervals[stage] = (low, high)
+
+    stages = sorted(intervals)
+    if intervals[stages[0]][0] < bounds[stages[0]][0]:
+        raise ValueError(f"GROWTH_STAGES_BD.{stages[0]} range goes below the stage start")
+    for stage, following in zip(stages, stages[1:]):
+        # Начало следующей стадии - порог предыдущей + 0.001
+        if intervals[stage][1] + 0.001 > intervals[following][0]:
+            raise ValueError(f"ranges of GROWTH_STAGES_BD.{stage} and GROWTH_STAGES_BD.{following} "
+                             f"can make growth stage thresholds non-increasing")
+
+
+def _gf2_mulmod(a, b, poly, degree):
+    result = 0
+    while b:
+        if b & 1:
+            result ^= a
+        b >>= 1
+        a <<= 1
+        if a >> degree & 1:
+            a ^= poly
+    return result
+
+
+def _is_primitive(poly, degree):
+    order = 2 ** degree - 1
+    factors = [p for p in range(2, order + 1) if order % p == 0 and all(p % q for q in range(2, int(p ** 0.5) + 1))]
+
+    def power(exponent):
+        result, base = 1, (2 if degree > 1 else 1)
+        while exponent:
+            if exponent & 1:
+                result = _gf2_mulmod(result, base, poly, degree)
+            base = _gf2_mulmod(base, base, poly, degree)
+            exponent >>= 1
+        return result
+
+    return power(order) == 1 and all(power(order // p) != 1 for p in factors)
+
+
+#Примитивные многочлены над GF(2) в порядке Джо-Куо: по степени, внутри степени - по коэффициентам a
+def _primitive_polynomials(count):
+    found = []
+    degree = 1
+    while len(found) < count:
+        for a in range(2 ** (degree - 1)):
+            if _is_primitive((1 << degree) | (a << 1) | 1, degree):
+                found.append((degree, a))
+                if len(found) == count:
+                    break
+        degree += 1
+    return found
+
+
+def _direction_numbers(dims):
+    directions = np.zeros((dims, _SOBOL_BITS), dtype=np.uint64)
+    directions[0] = [1 << (_SOBOL_BITS - k - 1) for k in range(_SOBOL_BITS)]
+    # Для измерений сверх таблицы начальные числа берутся случайными нечетными m_k < 2^k
+    rng = np.random.default_rng(0)
+    for j, (degree, a) in enumerate(_primitive_polynomials(dims - 1), start=1):
+        m = _SOBOL_M[j - 1] if j - 1 < len(_SOBOL_M) else [int(rng.integers(0, 2 ** (k - 1))) * 2 + 1
+                                                            for k in range(1, degree + 1)]
+        v = [int(m[k]) << (_SOBOL_BITS - k - 1) for k in range(degree)]
+        for k in range(degree, _SOBOL_BITS):
+            value = v[k - degree] ^ (v[k - degree] >> degree)
+            for l in range(1, degree):
+                if a >> (degree - 1 - l) & 1:
+                    value ^= v[k - l]
+            v.append(value)
+        directions[j] = v
+    return directions
+
+
+#Квазислучайная последовательность Соболя: n точек в [0, 1)^dims начиная с номера skip.
+#scramble_seed задает случайный цифровой сдвиг (XOR), который сохраняет равномерность сетки.
+def sobol_sequence(n, dims, skip=0, scramble_seed=None):
+    directions = _direction_numbers(dims)
+    index = np.arange(skip, skip + n, dtype=np.uint64)
+    gray = index ^ (index >> np.uint64(1))
+    points = np.zeros((n, dims), dtype=np.uint64)
+    for k in range(_SOBOL_BITS):
+        bit = ((gray >> np.uint64(k)) & np.uint64(1)).astype(bool)
+        points[bit] ^= directions[:, k]
+    if scramble_seed is not None:
+        shift = np.random.default_rng(scramble_seed).integers(0, 2 ** _SOBOL_BITS, dims, dtype=np.uint64)
+        points ^= shift
+    return points.astype(float) / 2.0 ** _SOBOL_BITS
+
+
+def _scale(unit, factors):
+    low = np.array([f[1] for f in factors], dtype=float)
+    high = np.array([f[2] for f in factors], dtype=float)
+    return low + unit * (high - low)
+
+
+#Схема Салтелли: матрицы A, B и A_B^i (столбец i из B) одна под другой, n * (k + 2) строк
+def saltelli_sample(factors, n, seed=None):
+    k = len(factors)
+    unit = sobol_sequence(n, 2 * k, skip=1 if seed is None else 0, scramble_seed=seed)
+    A, B = unit[:, :k], unit[:, k:]
+    blocks = [A, B]
+    for i in range(k):
+        AB = A.copy()
+        AB[:, i] = B[:, i]
+        blocks.append(AB)
+    return _scale(np.vstack(blocks), factors)
+
+
+#Траектории Морриса на сетке из levels уровней: каждая из trajectories траекторий - k + 1 точка,
+#соседние точки отличаются одним фактором на шаг delta. Возвращает (точки, порядок факторов, знаки шагов).
+def morris_sample(factors, trajectories=20, levels=4, seed=None):
+    rng = np.random.default_rng(seed)
+    k = len(factors)
+    delta = levels / (2 * (levels - 1))
+    starts = np.arange(levels) / (levels - 1)
+    starts = starts[starts <= 1 - delta + 1e-12]
+
+    orders = np.empty((trajectories, k), dtype=int)
+    signs = np.empty((trajectories, k))
+    unit = np.empty((trajectories, k + 1, k))
+    for r in range(trajectories):
+        base = rng.choice(starts, k)
+        sign = rng.choice((-1.0, 1.0), k)
+        order = rng.permutation(k)
+        x = np.where(sign > 0, base, base + delta)
+        unit[r, 0] = x
+        for step, i in enumerate(order, start=1):
+            x = x.copy()
+            x[i] += sign[i] * delta
+            unit[r, step] = x
+        orders[r] = order
+        signs[r] = sign[order]
+    return _scale(unit.reshape(-1, k), factors), orders, signs, delta
+
+
+#Генераторы общих случайных чисел: реплика rep любой строки получает один и тот же поток,
+#поэтому разности между строками отражают факторы, а не шум модели
+def _replicate_rngs(seed, n_rows, replicates):
+    return [np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(rep,)))
+            for _ in range(n_rows) for rep in range(replicates)]
+
+
+def _evaluate_rows(config, names, start, X):
+    traits = np.tile(np.asarray(config['base_traits'], dtype=float), (len(X), 1))
+    trait_columns = [i for i, name in enumerate(names) if name in TRAIT_NAMES]
+    parameter_columns = [i for i, name in enumerate(names) if name not in TRAIT_NAMES]
+    for i in trait_columns:
+        traits[:, TRAIT_NAMES.index(names[i])] = X[:, i]
+
+    if parameter_columns:
+        parameter_rows, group = np.unique(X[:, parameter_columns], axis=0, return_inverse=True)
+        group = group.reshape(-1)
+    else:
+        parameter_rows, group = np.zeros((1, 0)), np.zeros(len(X), dtype=int)
+
+    replicates = config['replicates']
+    yields = np.empty(len(X))
+    growth_times = np.empty(len(X))
+    for g, values in enumerate(parameter_rows):
+        rows = np.flatnonzero(group == g)
+        overrides = {names[i]: v for i, v in zip(parameter_columns, values)}
+        with model_parameters(overrides) if overrides else contextlib.nullcontext():
+            y, gt = calculate_yield_batch(
+                days=config['days'],
+                grain_params=(FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION),
+                initial_biomass=SEED_MASS,
+                traits_matrix=np.repeat(traits[rows], replicates, axis=0),
+                rngs=_replicate_rngs(config['base_seed'], len(rows), replicates),
+                forcing=get_forcing(config['latitude'], config['temperatures'], config['days'])
+            )
+        yields[rows] = y.reshape(len(rows), replicates).mean(axis=1)
+        growth_times[rows] = gt.reshape(len(rows), replicates).mean(axis=1)
+    return start, yields, growth_times
+
+
+#Средние по replicates урожай и время роста для каждой строки X (столбцы - факторы names).
+#Признаки вне names берутся из base_traits. Порции считаются в workers процессах.
+def evaluate_design(X, names, replicates=4, seed=0, workers=1, chunk_size=1024, base_traits=None,
+                    days=DAYS, temperatures=temperatures, latitude=55.7):
+    X = np.atleast_2d(np.asarray(X, dtype=float))
+    config = make_config(days, temperatures, latitude, base_seed=seed)
+    config['replicates'] = replicates
+    config['base_traits'] = (base_traits if base_traits is not None
+                             else [(low + high) / 2 for low, high in PARAM_RANGES])
+    names = list(names)
+    # Строки с одинаковыми константами модели собираются рядом, чтобы считаться одним пакетом
+    parameter_columns = [i for i, name in enumerate(names) if name not in TRAIT_NAMES]
+    order = np.lexsort(X[:, parameter_columns[::-1]].T) if parameter_columns else np.arange(len(X))
+    X = X[order]
+    bounds = [(start, min(start + chunk_size, len(X))) for start in range(0, len(X), chunk_size)]
+
+    results = {output: np.empty(len(X)) for output in OUTPUTS}
+    if workers <= 1 or len(bounds) <= 1:
+        chunks = (_evaluate_rows(config, names, start, X[start:stop]) for start, stop in bounds)
+        for start, y, gt in chunks:
+            results['yield'][start:start + len(y)] = y
+            results['growth_time'][start:start + len(y)] = gt
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_evaluate_rows, config, names, start, X[start:stop]) for start, stop in bounds]
+            for future in futures:
+                start, y, gt = future.result()
+                results['yield'][start:start + len(y)] = y
+                results['growth_time'][start:start + len(y)] = gt
+    for output, values in results.items():
+        results[output] = np.empty_like(values)
+        results[output][order] = values
+    return results
+
+
+#Выход без разброса дает индексы NaN во всех выборках бутстрепа, и интервал тоже NaN
+def _percentile_interval(samples, confidence):
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanquantile(samples, alpha, axis=0), np.nanquantile(samples, 1 - alpha, axis=0)
+
+
+#Первые (оценка Салтелли 2010) и полные (оценка Янсена) индексы Соболя по выходу схемы saltelli_sample.
+#Доверительные интервалы - перцентильный бутстреп по строкам базовых матриц.
+def sobol_indices(Y, k, n_bootstrap=1000, confidence=0.95, seed=None):
+    Y = np.asarray(Y, dtype=float)
+    n = len(Y) // (k + 2)
+    fA, fB = Y[:n], Y[n:2 * n]
+    fAB = Y[2 * n:].reshape(k, n)
+
+    def estimate(rows):
+        a, b, ab = fA[rows], fB[rows], np.moveaxis(fAB[:, rows], 0, -2)
+        variance = np.var(np.concatenate([a, b], axis=-1), axis=-1)[..., np.newaxis]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            first = np.mean(b[..., np.newaxis, :] * (ab - a[..., np.newaxis, :]), axis=-1) / variance
+            total = 0.5 * np.mean((a[..., np.newaxis, :] - ab) ** 2, axis=-1) / variance
+        return np.where(variance > 0, first, np.nan), np.where(variance > 0, total, np.nan)
+
+    S1, ST = estimate(np.arange(n))
+    rng = np.random.default_rng(seed)
+    S1_boot, ST_boot = [], []
+    # Бутстреп порциями, чтобы матрица индексов не превышала ~4 млн элементов
+    batch = max(1, 2 ** 22 // max(n * k, 1))
+    for begin in range(0, n_bootstrap, batch):
+        rows = rng.integers(0, n, (min(batch, n_bootstrap - begin), n))
+        first, total = estimate(rows)
+        S1_boot.append(first)
+        ST_boot.append(total)
+    S1_low, S1_high = _percentile_interval(np.concatenate(S1_boot), confidence)
+    ST_low, ST_high = _percentile_interval(np.concatenate(ST_boot), confidence)
+    return {'S1': S1, 'S1_low': S1_low, 'S1_high': S1_high, 'ST': ST, 'ST_low': ST_low, 'ST_high': ST_high}
+
+
+#Элементарные эффекты Морриса: mu, mu_star (среднее модулей) и sigma по траекториям,
+#доверительный интервал mu_star - бутстреп по траекториям
+def morris_indices(Y, orders, signs, delta, n_bootstrap=1000, confidence=0.95, seed=None):
+    trajectories, k = orders.shape
+    Y = np.asarray(Y, dtype=float).reshape(trajectories, k + 1)
+    effects = np.empty((trajectories, k))
+    rows = np.arange(trajectories)[:, np.newaxis]
+    effects[rows, orders] = np.diff(Y, axis=1) / (signs * delta)
+
+    rng = np.random.default_rng(seed)
+    samples = rng.integers(0, trajectories, (n_bootstrap, trajectories))
+    mu_star_low, mu_star_high = _percentile_interval(np.abs(effects)[samples].mean(axis=1), confidence)
+    return {
+        'mu': effects.mean(axis=0),
+        'mu_star': np.abs(effects).mean(axis=0),
+        'mu_star_low': mu_star_low,
+        'mu_star_high': mu_star_high,
+        'sigma': effects.std(axis=0, ddof=1) if trajectories > 1 else np.full(k, np.nan),
+    }
+
+
+def _run(method, factors, X, replicates, seed, workers, chunk_size, base_traits, model_kwargs, analyze):
+    names = [f[0] for f in factors]
+    started = time.perf_counter()
+    outputs = evaluate_design(X, names, replicates, seed, workers, chunk_size, base_traits, **model_kwargs)
+    seconds = time.perf_counter() - started
+    runs = len(X) * replicates
+    return {
+        'method': method,
+        'factors': factors,
+        'rows': len(X),
+        'replicates': replicates,
+        'runs': runs,
+        'seconds': seconds,
+        'runs_per_second': runs / seconds if seconds > 0 else float('inf'),
+        'indices': {output: analyze(values) for output, values in outputs.items()},
+    }
+
+
+#Индексы Соболя для урожая и времени роста: n базовых точек, n * (k + 2) строк схемы, каждая
+#усредняется по replicates прогонам. factors=None - четыре признака растения.
+def sobol_analysis(factors=None, n=1024, replicates=4, seed=0, workers=1, chunk_size=1024, base_traits=None,
+                   n_bootstrap=1000, confidence=0.95, **model_kwargs):
+    factors = factors if factors is not None else trait_factors()
+    validate_factors(factors)
+    X = saltelli_sample(factors, n, seed)
+    return _run('sobol', factors, X, replicates, seed, workers, chunk_size, base_traits, model_kwargs,
+                lambda Y: sobol_indices(Y, len(factors), n_bootstrap, confidence, seed))
+
+
+#Скрининг Морриса: trajectories траекторий по k + 1 точке на сетке из levels уровней
+def morris_analysis(factors=None, trajectories=50, levels=4, replicates=4, seed=0, workers=1, chunk_size=1024,
+                    base_traits=None, n_bootstrap=1000, confidence=0.95, **model_kwargs):
+    factors = factors if factors is not None else trait_factors()
+    validate_factors(factors)
+    X, orders, signs, delta = morris_sample(factors, trajectories, levels, seed)
+    return _run('morris', factors, X, replicates, seed, workers, chunk_size, base_traits, model_kwargs,
+                lambda Y: morris_indices(Y, orders, signs, delta, n_bootstrap, confidence, seed))
+
+
+#Таблица индексов: одна строка на (выход, фактор)
+def index_table(result):
+    table = []
+    for output, indices in result['indices'].items():
+        for i, (name, _, _) in enumerate(result['factors']):
+            row = {'output': output, 'factor': name}
+            row.update({key: float(values[i]) for key, values in indices.items()})
+            table.append(row)
+    return table
+
+
+def write_index_table(result, path):
+    table = index_table(result)
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(table[0]))
+        writer.writeheader()
+        writer.writerows(table)
+
+
+def format_index_table(result):
+    table = index_table(result)
+    keys = [key for key in table[0] if key not in ('output', 'factor')]
+    lines = ["{:<12} {:<28} ".format('output', 'factor') + " ".join(f"{key:>11}" for key in keys)]
+    for row in table:
+        lines.append("{:<12} {:<28} ".format(row['output'], row['factor']) +
+                     " ".join(f"{row[key]:>11.4f}" for key in keys))
+    lines.append(f"{result['runs']} runs in {result['seconds']:.1f} s ({result['runs_per_second']:.0f} runs/s)")
+    return "\n".join(lines)
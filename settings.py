@@ -65,6 +65,12 @@ CAPSULE_MASS = 0.5
 
 SOLAR_CONSTANT = 1368
 
+FITNESS_SEED = 42
+
+#Файл SQLite с уже посчитанной приспособленностью, например 'fitness_store.sqlite'. Относительный путь
+#берется от каталога пакета, а не от текущего каталога. None (по умолчанию) - хранилище выключено
+FITNESS_STORE_PATH = None
+
 def load_temperatures_from_csv(filename):
     temperatures = []
     with open(filename, 'r') as f:
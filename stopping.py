@@ -0,0 +1,80 @@
+import time
+
+STOP_REASONS = ('iterations', 'stagnation', 'target', 'diversity', 'time', 'evaluations')
+
+
+#Правила досрочной остановки ГА. Любое правило со значением None отключено.
+#stagnation - число поколений без улучшения лучшей приспособленности больше чем на tolerance,
+#target - целевой урожай, diversity_floor - нижняя граница генотипического разнообразия
+#(среднее попарное расстояние Хэмминга, деленное на длину генома),
+#max_seconds и max_evaluations - бюджеты времени и числа моделирований.
+class StoppingRules:
+    def __init__(self, stagnation=None, tolerance=0.0, target=None, diversity_floor=None,
+                 max_seconds=None, max_evaluations=None):
+        self.stagnation = stagnation
+        self.tolerance = tolerance
+        self.target = target
+        self.diversity_floor = diversity_floor
+        self.max_seconds = max_seconds
+        self.max_evaluations = max_evaluations
+        self._started = None
+        self._best = None
+        self._best_generation = 0
+
+    @property
+    def needs_diversity(self):
+        return self.diversity_floor is not None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._best = None
+        self._best_generation = 0
+
+    #Причина остановки после поколения generation (с нуля) или None, если продолжать
+    def check(self, generation, best_fitness, diversity=None, evaluations=0):
+        if self._started is None:
+            self.start()
+        if self._best is None or best_fitness > self._best + self.tolerance:
+            self._best = best_fitness
+            self._best_generation = generation
+
+        if self.target is not None and best_fitness >= self.target:
+            return 'target'
+        if self.stagnation is not None and generation - self._best_generation >= self.stagnation:
+            return 'stagnation'
+        if self.diversity_floor is not None and diversity is not None and diversity < self.diversity_floor:
+            return 'diversity'
+        if self.max_seconds is not None and time.perf_counter() - self._started >= self.max_seconds:
+            return 'time'
+        if self.max_evaluations is not None and evaluations >= self.max_evaluations:
+            return 'evaluations'
+        return None
+
+
+#Адаптивная частота мутаций: когда генотипическое разнообразие падает ниже low, частота
+#умножается на factor (не выше max_rate); когда разнообразие выше, возвращается к base_rate.
+class AdaptiveMutation:
+    def __init__(self, base_rate, low=0.05, factor=1.5, max_rate=0.5):
+        self.base_rate = base_rate
+        self.low = low
+        self.factor = factor
+        self.max_rate = max_rate
+        self.rate = base_rate
+
+    def update(self, diversity):
+        if diversity < self.low:
+            self.rate = min(self.rate * self.factor, self.max_rate)
+        else:
+            self.rate = max(self.rate / self.factor, self.base_rate)
+        return self.rate
+
+
+#Итоги запуска для словаря stats: причина остановки и сэкономленные оценки относительно полного числа поколений
+def stop_report(reason, generations, iterations, requests, requests_per_generation, simulations):
+    return {
+        'stop_reason': reason,
+        'generations': generations,
+        'evaluation_requests': requests,
+        'evaluation_requests_saved': (iterations - generations) * requests_per_generation,
+        'simulations': simulations,
+    }
@@ -0,0 +1,185 @@
+import bisect
+import itertools
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from evaluation import make_config, trait_key
+from fitness_cache import fitness_fingerprint
+from model import calculate_yield_batch, get_forcing, weather_hash
+from population import PARAM_RANGES
+from settings import DAYS, FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION, SEED_MASS, temperatures
+
+DEFAULT_POINTS = (9, 13, 11, 11)
+
+
+def metadata_path(path):
+    return str(path) + '.json'
+
+
+#Генератор строки зависит только от seed, номера узла и номера реплики, а не от разбиения на порции
+def _point_rngs(seed, points, replicates):
+    return [np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(int(point), rep)))
+            for point in points for rep in range(replicates)]
+
+
+def _surface_chunk(config, axes, start, stop):
+    shape = tuple(len(axis) for axis in axes)
+    points = np.arange(start, stop)
+    grid_index = np.unravel_index(points, shape)
+    traits = np.column_stack([np.asarray(axis)[idx] for axis, idx in zip(axes, grid_index)])
+    replicates = config['replicates']
+    yields, _ = calculate_yield_batch(
+        days=config['days'],
+        grain_params=(FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION),
+        initial_biomass=SEED_MASS,
+        traits_matrix=np.repeat(traits, replicates, axis=0),
+        rngs=_point_rngs(config['base_seed'], points, replicates),
+        forcing=get_forcing(config['latitude'], config['temperatures'], config['days'])
+    )
+    return start, yields.reshape(len(points), replicates).mean(axis=1)
+
+
+#Табулирует средний по replicates урожай на сетке points узлов по каждому признаку в ranges.
+#Таблица пишется в path как .npy (open_memmap), рядом - path.json с осями и отпечатком настроек и погоды.
+def build_yield_surface(path, points=DEFAULT_POINTS, ranges=PARAM_RANGES, replicates=4, seed=0, workers=1,
+                        chunk_size=2048, days=DAYS, temperatures=temperatures, latitude=55.7):
+    axes = [np.round(np.linspace(low, high, n), 2).tolist() for (low, high), n in zip(ranges, points)]
+    shape = tuple(len(axis) for axis in axes)
+    total = math.prod(shape)
+    config = make_config(days, temperatures, latitude, base_seed=seed)
+    config['replicates'] = replicates
+
+    table = np.lib.format.open_memmap(str(path), mode='w+', dtype=np.float64, shape=shape)
+    flat = table.reshape(-1)
+    bounds = [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+
+    if workers <= 1 or len(bounds) <= 1:
+        results = (_surface_chunk(config, axes, start, stop) for start, stop in bounds)
+        for start, values in results:
+            flat[start:start + len(values)] = values
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_surface_chunk, config, axes, start, stop) for start, stop in bounds]
+            for future in futures:
+                start, values = future.result()
+                flat[start:start + len(values)] = values
+    table.flush()
+    del table
+
+    metadata = {
+        'axes': axes,
+        'replicates': replicates,
+        'seed': seed,
+        'days': days,
+        'latitude': latitude,
+        'weather_hash': weather_hash(config['temperatures']),
+        'fingerprint': fitness_fingerprint(config),
+    }
+    with open(metadata_path(path), 'w') as f:
+        json.dump(metadata, f)
+    return YieldSurface.load(path)
+
+
+#Таблица урожая на сетке признаков с полилинейной интерполяцией.
+#Признаки вне сетки прижимаются к ее границам.
+class YieldSurface:
+    def __init__(self, table, axes, metadata=None):
+        self.table = table
+        self.axes = [list(map(float, axis)) for axis in axes]
+        self.metadata = metadata or {}
+        self._flat = table.reshape(-1)
+        self._strides = [int(np.prod(table.shape[i + 1:])) for i in range(table.ndim)]
+        self._corners = list(itertools.product((0, 1), repeat=table.ndim))
+        self._axes_arrays = [np.asarray(axis) for axis in self.axes]
+
+    #check=True сверяет отпечаток таблицы с текущими настройками модели и погодой
+    @classmethod
+    def load(cls, path, mmap_mode='r', check=True, temperatures=temperatures):
+        with open(metadata_path(path)) as f:
+            metadata = json.load(f)
+        if check:
+            config = make_config(metadata['days'], temperatures, metadata['latitude'], base_seed=metadata['seed'])
+            if fitness_fingerprint(config) != metadata['fingerprint']:
+                raise ValueError(f"yield surface {path} was built with different settings or weather")
+        table = np.load(str(path), mmap_mode=mmap_mode)
+        return cls(table, metadata['axes'], metadata)
+
+    def _locate(self, axis, value):
+        last = len(axis) - 1
+        if last == 0 or value <= axis[0]:
+            return 0, 0.0
+        if value >= axis[last]:
+            return last - 1, 1.0
+        i = bisect.bisect_right(axis, value) - 1
+        return i, (value - axis[i]) / (axis[i + 1] - axis[i])
+
+    def lookup(self, traits):
+        cells = [self._locate(axis, float(value)) for axis, value in zip(self.axes, traits)]
+        base = sum(i * stride for (i, _), stride in zip(cells, self._strides))
+        result = 0.0
+        for corner in self._corners:
+            weight = 1.0
+            offset = base
+            for bit, (i, frac), stride, axis in zip(corner, cells, self._strides, self.axes):
+                if bit:
+                    if len(axis) == 1:
+                        weight = 0.0
+                        break
+                    weight *= frac
+                    offset += stride
+                else:
+                    weight *= 1.0 - frac
+            if weight:
+                result += weight * self._flat.item(offset)
+        return result
+
+    def lookup_batch(self, traits_matrix):
+        traits_matrix = np.atleast_2d(np.asarray(traits_matrix, dtype=float))
+        n = len(traits_matrix)
+        index = np.zeros((n, self.table.ndim), dtype=np.int64)
+        frac = np.zeros((n, self.table.ndim))
+        for d, axis in enumerate(self._axes_arrays):
+            if len(axis) == 1:
+                continue
+            values = np.clip(traits_matrix[:, d], axis[0], axis[-1])
+            i = np.clip(np.searchsorted(axis, values, side='right') - 1, 0, len(axis) - 2)
+            index[:, d] = i
+            frac[:, d] = (values - axis[i]) / (axis[i + 1] - axis[i])
+
+        strides = np.asarray(self._strides)
+        result = np.zeros(n)
+        for corner in self._corners:
+            corner = np.asarray(corner)
+            if np.any(corner & (np.asarray(self.table.shape) == 1)):
+                continue
+            weight = np.prod(np.where(corner, frac, 1.0 - frac), axis=1)
+            result += weight * self._flat[(index + corner) @ strides]
+        return result
+
+
+#Замена FitnessEvaluator, отвечающая по таблице вместо моделирования, - для ГА и перебора признаков,
+#когда точное моделирование не требуется
+class SurfaceEvaluator:
+    def __init__(self, surface):
+        self.surface = surface
+        self.fingerprint = surface.metadata.get('fingerprint')
+        self.evaluations = 0
+
+    def evaluate(self, trait_sets, use_cache=True):
+        keys = list(dict.fromkeys(trait_key(traits) for traits in trait_sets))
+        if not keys:
+            return {}
+        values = self.surface.lookup_batch(np.array(keys))
+        return dict(zip(keys, values.tolist()))
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
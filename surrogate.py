@@ -0,0 +1,122 @@
+import numpy as np
+
+
+#Гребневая регрессия на случайных признаках Фурье (приближение гауссовского процесса с RBF-ядром).
+#Признаки нормируются на диапазоны low..high, обучение онлайн: копятся Ф'Ф и Ф'y, решение - при прогнозе.
+class RandomFeaturesRidge:
+    def __init__(self, low, high, n_features=256, length_scale=0.25, alpha=1e-3, seed=0):
+        rng = np.random.default_rng(seed)
+        self.low = np.asarray(low, dtype=float)
+        self.span = np.asarray(high, dtype=float) - self.low
+        self.span[self.span == 0] = 1.0
+        self.frequencies = rng.normal(0.0, 1.0 / length_scale, (len(self.low), n_features))
+        self.phases = rng.uniform(0.0, 2 * np.pi, n_features)
+        self.gram = alpha * np.eye(n_features + 1)
+        self.moment = np.zeros(n_features + 1)
+        self.n_samples = 0
+        self._coef = None
+
+    def features(self, X):
+        Z = (np.atleast_2d(np.asarray(X, dtype=float)) - self.low) / self.span
+        n_features = len(self.phases)
+        phi = np.sqrt(2.0 / n_features) * np.cos(Z @ self.frequencies + self.phases)
+        return np.hstack([phi, np.ones((len(Z), 1))])
+
+    def update(self, X, y):
+        phi = self.features(X)
+        self.gram += phi.T @ phi
+        self.moment += phi.T @ np.asarray(y, dtype=float)
+        self.n_samples += len(phi)
+        self._coef = None
+
+    def predict(self, X):
+        if self._coef is None:
+            self._coef = np.linalg.solve(self.gram, self.moment)
+        return self.features(X) @ self._coef
+
+
+#Ранговая корреляция Спирмена (без поправки на совпадения)
+def rank_correlation(a, b):
+    if len(a) < 2:
+        return float('nan')
+    ra = np.argsort(np.argsort(a)).astype(float)
+    rb = np.argsort(np.argsort(b)).astype(float)
+    if ra.std() == 0 or rb.std() == 0:
+        return float('nan')
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+#Предварительный отбор потомков суррогатной моделью: моделируются только fraction лучших по прогнозу
+#и exploration случайных из остальных, остальные получают прогноз вместо урожая.
+#Пока в модели меньше min_samples точек, моделируются все. Собственный генератор не сдвигает поток ГА.
+class SurrogateScreen:
+    def __init__(self, fraction=0.5, exploration=0.1, min_samples=60, n_features=256, length_scale=0.25,
+                 alpha=1e-3, seed=0):
+        self.fraction = fraction
+        self.exploration = exploration
+        self.min_samples = min_samples
+        self.n_features = n_features
+        self.length_scale = length_scale
+        self.alpha = alpha
+        self.rng = np.random.default_rng(seed)
+        self.model = None
+        self.log = []
+        self.simulations = 0
+        self.verified = 0
+
+    def bind(self, low, high):
+        if self.model is None:
+            self.model = RandomFeaturesRidge(low, high, self.n_features, self.length_scale, self.alpha,
+                                             int(self.rng.integers(2 ** 32)))
+
+    @property
+    def ready(self):
+        return self.model is not None and self.model.n_samples >= self.min_samples
+
+    #Каждое настоящее моделирование ГА; verified - досчет особей, которые раньше получили прогноз
+    def observe(self, traits, values, verified=False):
+        if len(values):
+            self.model.update(traits, values)
+            self.simulations += len(values)
+            if verified:
+                self.verified += len(values)
+
+    #(маска моделируемых потомков, прогноз) для матрицы признаков
+    def screen(self, traits):
+        n = len(traits)
+        if not self.ready:
+            return np.ones(n, dtype=bool), None
+        predicted = self.model.predict(traits)
+        chosen = np.zeros(n, dtype=bool)
+        n_top = int(np.ceil(self.fraction * n))
+        chosen[np.argsort(-predicted, kind='stable')[:n_top]] = True
+        rest = np.flatnonzero(~chosen)
+        n_explore = min(len(rest), int(np.ceil(self.exploration * n)))
+        if n_explore:
+            chosen[self.rng.choice(rest, n_explore, replace=False)] = True
+        return chosen, predicted
+
+    def record(self, generation, chosen, predicted, true_values):
+        self.log.append({
+            'generation': generation,
+            'simulated': int(chosen.sum()),
+            'screened_out': int((~chosen).sum()),
+            'rank_correlation': rank_correlation(predicted[chosen], true_values) if predicted is not None
+            else float('nan'),
+        })
+
+    #Экономия - доля моделирований, которых не было по сравнению с запуском без суррогата. Без него
+    #моделировался бы каждый отсеянный потомок, зато не было бы досчета прогнозов (verified).
+    def summary(self):
+        screened = sum(entry['screened_out'] for entry in self.log)
+        simulated = sum(entry['simulated'] for entry in self.log)
+        correlations = [entry['rank_correlation'] for entry in self.log if not np.isnan(entry['rank_correlation'])]
+        without_surrogate = self.simulations - self.verified + screened
+        return {
+            'surrogate_screened_out': screened,
+            'surrogate_simulated': simulated,
+            'surrogate_verified': self.verified,
+            'surrogate_savings': 1 - self.simulations / without_surrogate if without_surrogate else 0.0,
+            'surrogate_mean_rank_correlation': float(np.mean(correlations)) if correlations else float('nan'),
+            'surrogate_log': self.log,
+        }
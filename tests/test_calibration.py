@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from calibration import calibrate
+
+TRAITS = (0.71, 110.7, 0.8, 2.5)
+OBSERVATIONS = {'height': ([20, 40, 60, 80, 100], [5.0, 20.0, 45.0, 65.0, 78.97])}
+
+
+def test_invalid_parameter_sets_are_rejected_not_fatal():
+    # Диапазоны соседних порогов пересекаются, часть точек опроса недопустима
+    parameters = [('GROWTH_STAGES_BD.2', 15.0, 25.0), ('GROWTH_STAGES_BD.3', 20.0, 30.0)]
+    result = calibrate(OBSERVATIONS, parameters, TRAITS, replicates=2, screen_replicates=1, initial_step=0.5,
+                       max_iterations=3)
+    assert result['iterations'] == 3
+    assert result['rejected'] > 0
+    assert np.isfinite(result['loss'])
+
+
+def test_resume_refuses_checkpoint_for_other_inputs(tmp_path):
+    checkpoint = tmp_path / 'calibration.json'
+    parameters = [('CONVERSION_FACTORS.stem', 0.6, 1.1)]
+    first = calibrate(OBSERVATIONS, parameters, TRAITS, replicates=2, max_iterations=2, checkpoint=checkpoint)
+    resumed = calibrate(OBSERVATIONS, parameters, TRAITS, replicates=2, max_iterations=4, checkpoint=checkpoint)
+    assert resumed['iterations'] == 4 and resumed['loss'] <= first['loss']
+
+    other = {'height': ([20, 40, 60, 80, 100], [5.0, 20.0, 45.0, 65.0, 70.0])}
+    for kwargs in ({'observations': other}, {'traits': (0.7, 93.66, 0.72, 0.97)}, {'seed': 1}):
+        arguments = {'observations': OBSERVATIONS, 'traits': TRAITS, 'seed': 0, **kwargs}
+        with pytest.raises(ValueError):
+            calibrate(arguments['observations'], parameters, arguments['traits'], replicates=2, max_iterations=4,
+                      checkpoint=checkpoint, seed=arguments['seed'])
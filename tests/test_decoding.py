@@ -0,0 +1,41 @@
+import random
+
+import numpy as np
+import pytest
+
+from decoding import DIPLOID, HAPLOID, CompiledDecoder
+from genome import GenomePopulation
+from population import generate_configs_1
+from population_2 import generate_configs_2
+
+
+def _configs(encoding):
+    random.seed(0)
+    np.random.seed(0)
+    if encoding is DIPLOID:
+        return generate_configs_1(), 400
+    return generate_configs_2(), 100
+
+
+# Сырые оценки пересчитываются от поколения к поколению только инкрементально, без полного декодирования
+@pytest.mark.parametrize('encoding', [DIPLOID, HAPLOID])
+def test_rescore_matches_full_decode_after_crossover_and_mutation(encoding):
+    configs, n_loci = _configs(encoding)
+    decoder = CompiledDecoder(configs, encoding)
+    rng = np.random.default_rng(1)
+    population = GenomePopulation.random(30, n_loci, encoding.bits_per_locus, rng)
+    raw = decoder.raw_scores(population.genomes)
+
+    for _ in range(40):
+        parents_a, parents_b = rng.integers(0, len(population), (2, len(population)))
+        children = population.crossover(parents_a, parents_b, rng).mutate(0.08, rng)
+        raw = decoder.rescore(raw, population, children)
+        np.testing.assert_allclose(raw, decoder.raw_scores(children.genomes), rtol=0, atol=1e-9)
+        np.testing.assert_array_equal(decoder.traits_from_raw(raw), decoder.decode(children.genomes))
+        population = children
+
+    population = population.take(np.arange(len(population)))
+    mutated_only = population.mutate(0.08, rng)
+    np.testing.assert_allclose(decoder.rescore(raw, population, mutated_only),
+                               decoder.raw_scores(mutated_only.genomes), rtol=0, atol=1e-9)
+
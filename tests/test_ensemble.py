@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from ensemble import ensemble_statistics, ensemble_yields, run_ensemble
+from model import Simulation
+from settings import CAPSULE_MASS, DAYS, FLOWERING_START_DAY, GRAIN_FILLING_DURATION, SEED_MASS, temperatures
+
+TRAITS = (0.71, 110.7, 0.8, 2.5)
+
+
+def test_replicates_do_not_depend_on_workers_or_chunks():
+    serial = run_ensemble(TRAITS, 6, seed=11)
+    parallel = run_ensemble(TRAITS, 6, seed=11, workers=2, chunk_size=2)
+    assert ensemble_yields(serial).tolist() == ensemble_yields(parallel).tolist()
+    assert ensemble_yields(run_ensemble(TRAITS, 6, seed=12)).tolist() != ensemble_yields(serial).tolist()
+
+
+def test_shared_prefix_matches_an_independent_run():
+    seq = np.random.SeedSequence(11).spawn(1)[0]
+    direct = Simulation(DAYS, (FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION), SEED_MASS, TRAITS,
+                        temperatures=temperatures, latitude=55.7, trace='summary',
+                        rng=np.random.default_rng(seq)).run()
+    assert run_ensemble(TRAITS, 1, seed=11)[0]['yield'] == direct['yield']
+
+
+def test_batched_replicates_are_reproducible_pairs():
+    first = run_ensemble(TRAITS, 4, seed=3, batched=True)
+    assert first == run_ensemble(TRAITS, 4, seed=3, batched=True, workers=2, chunk_size=1)
+    assert all(len(pair) == 2 for pair in first)
+    assert ensemble_yields(first).tolist() == [pair[0] for pair in first]
+
+
+def test_statistics_use_a_normal_interval():
+    stats = ensemble_statistics([1.0, 2.0, 3.0, 4.0])
+    assert stats['mean'] == 2.5 and stats['std'] == pytest.approx(np.std([1, 2, 3, 4], ddof=1))
+    assert stats['ci_high'] - stats['mean'] == pytest.approx(1.959964 * stats['std'] / 2, rel=1e-6)
+    assert ensemble_statistics([5.0])['ci_low'] == 5.0
@@ -0,0 +1,52 @@
+import os
+
+import fitness_store
+import model
+import settings
+from evaluation import FitnessEvaluator, simulate_traits
+from fitness_cache import FitnessCache, fitness_fingerprint
+from fitness_store import FitnessStore, default_fitness_store
+
+TRAITS = (0.71, 110.7, 0.8, 2.5)
+
+
+def test_fingerprint_tracks_model_version_and_overrides(monkeypatch):
+    evaluator = FitnessEvaluator(cache=False, store=False)
+    default = evaluator.fingerprint
+    with model.model_parameters({'GROWTH_STAGES_BD.6': 40}):
+        assert evaluator.fingerprint != default
+    assert evaluator.fingerprint == default
+    monkeypatch.setattr('fitness_cache.MODEL_VERSION', model.MODEL_VERSION + 1)
+    assert fitness_fingerprint(evaluator.config) != default
+
+
+def test_store_does_not_serve_values_across_overrides(tmp_path):
+    store = FitnessStore(str(tmp_path / 'fitness.sqlite'))
+    with FitnessEvaluator(cache=FitnessCache(), store=store) as evaluator:
+        default = evaluator.evaluate([TRAITS])[TRAITS]
+        with model.model_parameters({'GROWTH_STAGES_BD.6': 40}):
+            overridden = evaluator.evaluate([TRAITS])[TRAITS]
+            assert overridden == simulate_traits(TRAITS)[0]
+        assert evaluator.evaluations == 2
+        assert evaluator.evaluate([TRAITS])[TRAITS] == default
+    assert overridden != default
+
+
+def test_process_workers_follow_parent_parameters():
+    trait_sets = [TRAITS, (0.7, 93.66, 0.72, 0.97)]
+    with FitnessEvaluator('process', 2, cache=False, store=False) as pool:
+        with model.model_parameters({'GROWTH_STAGES_BD.6': 40}):
+            assert pool.evaluate(trait_sets) == {t: simulate_traits(t)[0] for t in trait_sets}
+        assert pool.evaluate(trait_sets) == {t: simulate_traits(t)[0] for t in trait_sets}
+
+
+def test_store_is_opt_in_and_anchored_to_the_package(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with FitnessEvaluator(cache=False) as evaluator:
+        assert evaluator.store is None
+        evaluator.evaluate([TRAITS])
+    assert list(tmp_path.iterdir()) == []
+
+    monkeypatch.setattr(settings, 'FITNESS_STORE_PATH', 'fitness_store.sqlite')
+    package = os.path.dirname(os.path.abspath(fitness_store.__file__))
+    assert default_fitness_store().path == os.path.join(package, 'fitness_store.sqlite')
@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+from decoding import DIPLOID, HAPLOID
+from genome import GenomePopulation, PackedGenomes, genotype_diversity, popcount
+
+
+@pytest.mark.parametrize('length', [1, 63, 64, 65, 800])
+def test_packed_genomes_round_trip(length):
+    genomes = np.random.default_rng(length).integers(0, 2, (7, length * 2)).astype(np.uint8)
+    packed = PackedGenomes.from_bits(genomes, bits_per_locus=2)
+    assert packed.words.dtype == np.uint64 and packed.nbytes == 7 * 8 * -(-length * 2 // 64)
+    unpacked = packed.unpack()
+    np.testing.assert_array_equal(unpacked.genomes, genomes)
+    assert unpacked.bits_per_locus == 2
+
+
+def test_distances_match_unpacked_hamming():
+    genomes = np.random.default_rng(0).integers(0, 2, (12, 150)).astype(np.uint8)
+    packed = PackedGenomes.from_bits(genomes)
+    expected = (genomes[:, None, :] != genomes[None, :, :]).sum(axis=2)
+    np.testing.assert_array_equal(packed.pairwise_distances(block_bytes=64), expected)
+    assert packed.hamming(3, 5) == expected[3, 5]
+    assert packed.mean_pairwise_distance() == pytest.approx(expected[np.triu_indices(12, 1)].mean())
+
+
+def test_popcount_counts_bits_of_each_word():
+    words = np.array([0, 1, 2 ** 63, 2 ** 64 - 1], dtype=np.uint64)
+    assert popcount(words).tolist() == [0, 1, 1, 64]
+
+
+def test_genotype_diversity_of_identical_homozygotes():
+    population = GenomePopulation(np.ones((5, 20), dtype=np.uint8), bits_per_locus=2)
+    stats = genotype_diversity(population, DIPLOID)
+    assert stats['mean_distance'] == 0.0
+    assert stats['heterozygosity'] == 0.0 and stats['expected_heterozygosity'] == 0.0
+    assert 'heterozygosity' not in genotype_diversity(GenomePopulation(np.ones((5, 20), dtype=np.uint8)), HAPLOID)
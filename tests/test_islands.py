@@ -0,0 +1,58 @@
+import random
+
+import numpy as np
+import pytest
+
+import islands
+from ga import OptimizedGA
+from population import N_LOCI, Plant_1, generate_configs_1
+
+SEED = 5
+ISLAND_SEEDS = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(SEED).spawn(2)]
+_original_worker = islands._island_worker
+
+
+def _configs():
+    random.seed(0)
+    np.random.seed(0)
+    return generate_configs_1()
+
+
+def _run(**kwargs):
+    return islands.genetic_algorithm_islands(_configs(), Plant_1, N_LOCI, n_islands=2, interval=2,
+                                             population_size=10, iterations=4, seed=SEED, **kwargs)
+
+
+def _raise(self):
+    raise ValueError("broken island")
+
+
+# Второй остров падает на первом же поколении
+def _failing_second_island(conn, seed, *args):
+    if seed == ISLAND_SEEDS[1]:
+        OptimizedGA.step = _raise
+    _original_worker(conn, seed, *args)
+
+
+# Все острова падают
+def _failing_every_island(conn, seed, *args):
+    OptimizedGA.step = _raise
+    _original_worker(conn, seed, *args)
+
+
+def test_islands_run_with_forwarded_evaluator_options(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    stats = {}
+    best, fitness_history, diversity_history, _, snapshots = _run(
+        stats=stats, evaluator_options={'cache': False, 'store': False})
+    assert len(fitness_history) == len(diversity_history) == 4
+    assert stats['migrations'] == 1 and stats['simulations'] > 0
+    assert len(snapshots) == 3 and isinstance(best, Plant_1)
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize('worker', [_failing_second_island, _failing_every_island])
+def test_island_failure_reaches_the_caller(monkeypatch, worker):
+    monkeypatch.setattr(islands, '_island_worker', worker)
+    with pytest.raises(RuntimeError, match='broken island'):
+        _run(evaluator_options={'store': False})
@@ -0,0 +1,41 @@
+import random
+
+import numpy as np
+import pytest
+
+from model import Simulation, calculate_yield
+from settings import DAYS, FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION, SEED_MASS, temperatures
+
+GRAIN_PARAMS = (FLOWERING_START_DAY, CAPSULE_MASS, GRAIN_FILLING_DURATION)
+
+# Урожай исходной (до векторизации) модели при random.seed(seed) и np.random.seed(seed)
+BASELINE_YIELDS = [
+    (0, (0.71, 110.7, 0.8, 2.5), 14.153141195226533),
+    (1, (0.7, 93.66, 0.72, 0.97), 27.42153339671058),
+    (7, (0.6, 45.0, 1.2, 4.0), 11.242098122719833),
+    (42, (0.85, 150.0, 0.3, 1.5), 21.12266137689891),
+]
+
+
+@pytest.mark.parametrize('seed, traits, expected', BASELINE_YIELDS)
+def test_legacy_calculate_yield_matches_baseline(seed, traits, expected):
+    random.seed(seed)
+    np.random.seed(seed)
+    result = calculate_yield(DAYS, GRAIN_PARAMS, SEED_MASS, temperatures, 55.7, list(traits))
+    assert result[0] == pytest.approx(expected, rel=1e-12)
+
+
+def test_save_load_resumes_generator_stream(tmp_path):
+    traits = (0.71, 110.7, 0.8, 2.5)
+    uninterrupted = Simulation(DAYS, GRAIN_PARAMS, SEED_MASS, traits, temperatures=temperatures, latitude=55.7,
+                               trace='none', rng=np.random.default_rng(3)).run()
+
+    simulation = Simulation(DAYS, GRAIN_PARAMS, SEED_MASS, traits, temperatures=temperatures, latitude=55.7,
+                            trace='none', rng=np.random.default_rng(3))
+    simulation.run_until(day=40)
+    path = tmp_path / 'simulation.pkl'
+    simulation.save(path)
+
+    resumed = Simulation.load(path)
+    resumed.run_until()
+    assert resumed.result() == uninterrupted
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from evaluation import FitnessEvaluator
+from fitness_cache import FitnessCache
+from optimizers import CMAES, ContinuousOptimizer, DifferentialEvolution, make_optimizer, optimize_traits
+from population import PARAM_RANGES
+from stopping import StoppingRules
+
+LOW = np.array([-5.0, -5.0, -5.0])
+HIGH = np.array([5.0, 5.0, 5.0])
+OPTIMUM = np.array([1.0, -2.0, 0.5])
+
+
+def _quadratic(X):
+    return -np.sum((np.asarray(X) - OPTIMUM) ** 2, axis=1)
+
+
+def _run(optimizer, generations):
+    for _ in range(generations):
+        X = optimizer.ask()
+        assert X.shape == (optimizer.population_size, 3)
+        assert np.all((X >= LOW) & (X <= HIGH))
+        optimizer.tell(X, _quadratic(X))
+    return optimizer
+
+
+@pytest.mark.parametrize('method, generations', [('cmaes', 80), ('de', 150)])
+def test_optimizers_find_the_maximum_of_a_quadratic(method, generations):
+    optimizer = _run(make_optimizer(method, LOW, HIGH, seed=0), generations)
+    np.testing.assert_allclose(optimizer.best_x, OPTIMUM, atol=1e-2)
+    assert optimizer.best_fitness > -1e-3
+    assert optimizer.spread < 0.05
+
+
+def test_runs_are_reproducible_for_a_seed():
+    first = _run(CMAES(LOW, HIGH, seed=3), 10)
+    second = _run(CMAES(LOW, HIGH, seed=3), 10)
+    assert first.best_fitness == second.best_fitness
+    assert np.array_equal(first.best_x, second.best_x)
+
+
+def test_differential_evolution_never_loses_a_parent_to_a_worse_trial():
+    optimizer = DifferentialEvolution(LOW, HIGH, seed=1)
+    _run(optimizer, 1)
+    previous = optimizer.fitness.copy()
+    _run(optimizer, 1)
+    assert np.all(optimizer.fitness >= previous)
+
+
+def test_base_class_is_abstract_and_methods_are_validated():
+    with pytest.raises(TypeError):
+        ContinuousOptimizer(LOW, HIGH)
+    with pytest.raises(ValueError):
+        make_optimizer('nelder-mead', LOW, HIGH)
+
+
+def test_optimize_traits_stays_in_the_box_and_reports_stats():
+    stats = {}
+    with FitnessEvaluator(cache=FitnessCache(), store=False) as evaluator:
+        traits, fitness, history = optimize_traits(PARAM_RANGES, 'de', evaluator, StoppingRules(max_evaluations=60),
+                                                   stats, seed=0)
+    assert all(low <= t <= high for t, (low, high) in zip(traits, PARAM_RANGES))
+    assert stats['stop_reason'] == 'evaluations' and stats['simulations'] >= 60
+    assert fitness == max(history) and history == sorted(history)
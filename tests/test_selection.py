@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from selection import select_parents, stochastic_universal_sampling, tournament, truncation
+
+
+def test_truncation_matches_stable_argsort_including_ties():
+    rng = np.random.default_rng(0)
+    fitness = rng.integers(0, 5, 200).astype(float)
+    for k in (1, 7, 40, 199, 200, 500):
+        np.testing.assert_array_equal(truncation(fitness, k), np.argsort(-fitness, kind='stable')[:k])
+    assert truncation(fitness, 0).size == 0
+
+
+def test_truncation_breaks_ties_by_lower_index():
+    np.testing.assert_array_equal(truncation([1.0, 3.0, 3.0, 2.0, 3.0], 2), [1, 2])
+
+
+def test_tournament_winner_is_best_contestant():
+    fitness = np.arange(10, dtype=float)
+    winners = tournament(fitness, 1000, k=10, rng=np.random.default_rng(1))
+    assert winners.mean() > 8
+    assert set(tournament(fitness, 50, k=1, rng=np.random.default_rng(1))) <= set(range(10))
+
+
+def test_sus_selects_in_proportion_to_fitness():
+    selected = stochastic_universal_sampling([1.0, 0.0, 3.0], 400, rng=np.random.default_rng(2))
+    counts = np.bincount(selected, minlength=3)
+    assert counts.tolist() == [100, 0, 300]
+    # Нулевая сумма - равномерный выбор
+    assert np.bincount(stochastic_universal_sampling([0.0, 0.0], 10, rng=np.random.default_rng(2))).tolist() == [5, 5]
+
+
+@pytest.mark.parametrize('method', ['truncation', 'tournament', 'sus'])
+def test_select_parents_returns_a_pair_per_child(method):
+    fitness = np.random.default_rng(3).random(50)
+    parents_a, parents_b = select_parents(fitness, 30, method, pool_size=10, rng=np.random.default_rng(4))
+    assert len(parents_a) == len(parents_b) == 30
+    if method == 'truncation':
+        assert set(parents_a) | set(parents_b) <= set(truncation(fitness, 10))
+
+
+def test_select_parents_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        select_parents(np.ones(4), 2, 'roulette')
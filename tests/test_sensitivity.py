@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from sensitivity import morris_analysis, parameter_factors, sobol_analysis, threshold_limits, validate_factors
+
+THRESHOLDS = ['GROWTH_STAGES_BD.2', 'GROWTH_STAGES_BD.3', 'GROWTH_STAGES_BD.6']
+
+
+def test_threshold_factors_stay_between_neighbours():
+    factors = parameter_factors(THRESHOLDS, spread=0.5)
+    for name, low, high in factors:
+        limit_low, limit_high = threshold_limits(int(name.split('.')[1]))
+        assert limit_low <= low < high <= limit_high
+
+
+def test_crossing_threshold_ranges_are_rejected_up_front():
+    with pytest.raises(ValueError):
+        validate_factors([('GROWTH_STAGES_BD.2', 15.0, 25.0), ('GROWTH_STAGES_BD.3', 20.0, 30.0)])
+    with pytest.raises(ValueError):
+        sobol_analysis([('GROWTH_STAGES_BD.2', 15.0, 25.0), ('GROWTH_STAGES_BD.3', 20.0, 30.0)], n=4)
+
+
+def test_small_analyses_with_stage_thresholds():
+    factors = parameter_factors(THRESHOLDS + ['CRPAR'], spread=0.5)
+    morris = morris_analysis(factors, trajectories=3, replicates=1, n_bootstrap=20)
+    sobol = sobol_analysis(factors, n=8, replicates=1, n_bootstrap=20)
+    for result in (morris, sobol):
+        for indices in result['indices'].values():
+            assert all(len(values) == len(factors) for values in indices.values())
+    assert np.all(np.isfinite(morris['indices']['growth_time']['mu_star']))
@@ -0,0 +1,51 @@
+import random
+
+import numpy as np
+
+from evaluation import FitnessEvaluator
+from fitness_cache import FitnessCache
+from ga import genetic_algorithm_optimized
+from population import N_LOCI, Plant_1, generate_configs_1
+from stopping import AdaptiveMutation, StoppingRules, stop_report
+
+
+def test_stagnation_counts_generations_without_improvement_beyond_tolerance():
+    rules = StoppingRules(stagnation=3, tolerance=0.1)
+    history = [1.0, 1.05, 1.08, 1.2, 1.25, 1.29, 1.3]
+    reasons = [rules.check(generation, best) for generation, best in enumerate(history)]
+    # 1.2 - единственное улучшение больше чем на 0.1, после него три поколения без улучшения
+    assert reasons == [None] * 6 + ['stagnation']
+
+
+def test_first_matching_rule_wins():
+    assert StoppingRules(target=5.0, max_evaluations=1).check(0, 5.0, evaluations=10) == 'target'
+    assert StoppingRules(diversity_floor=0.1).check(0, 1.0, diversity=0.05) == 'diversity'
+    assert StoppingRules(diversity_floor=0.1).check(0, 1.0, diversity=None) is None
+    assert StoppingRules(max_evaluations=100).check(0, 1.0, evaluations=100) == 'evaluations'
+    assert StoppingRules(max_seconds=0.0).check(0, 1.0) == 'time'
+    assert StoppingRules().check(0, 1.0) is None
+
+
+def test_adaptive_mutation_rises_on_low_diversity_and_decays_back():
+    mutation = AdaptiveMutation(0.08, low=0.05, factor=2.0, max_rate=0.2)
+    assert [mutation.update(0.01) for _ in range(3)] == [0.16, 0.2, 0.2]
+    assert [mutation.update(0.5) for _ in range(3)] == [0.1, 0.08, 0.08]
+
+
+def test_stop_report_counts_saved_requests():
+    report = stop_report('target', 4, 10, 100, 18, 90)
+    assert report['evaluation_requests_saved'] == 6 * 18 and report['stop_reason'] == 'target'
+
+
+def test_ga_stops_on_stagnation_and_reports_it():
+    random.seed(0)
+    np.random.seed(0)
+    configs = generate_configs_1()
+    stats = {}
+    with FitnessEvaluator(cache=FitnessCache(), store=False) as evaluator:
+        _, fitness_history, *_ = genetic_algorithm_optimized(configs, Plant_1, N_LOCI, evaluator, stats,
+                                                             population_size=20, iterations=200,
+                                                             stopping=StoppingRules(stagnation=5))
+    assert stats['stop_reason'] == 'stagnation'
+    assert stats['generations'] == len(fitness_history) < 200
+    assert max(fitness_history[-6:]) == fitness_history[-6]
@@ -0,0 +1,47 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from surface import SurfaceEvaluator, YieldSurface, build_yield_surface
+
+AXES = [[0.5, 0.7, 0.9], [0.0, 90.0, 180.0], [0.1, 1.5], [0.0, 2.5, 5.0]]
+WEIGHTS = np.array([2.0, 0.01, -1.0, 0.3])
+
+
+def _linear_surface():
+    grid = np.stack(np.meshgrid(*AXES, indexing='ij'), axis=-1)
+    return YieldSurface(grid @ WEIGHTS + 1.0, AXES)
+
+
+def test_lookup_is_exact_at_grid_nodes():
+    surface = _linear_surface()
+    for index in itertools.product(*(range(len(axis)) for axis in AXES)):
+        node = [axis[i] for axis, i in zip(AXES, index)]
+        assert surface.lookup(node) == surface.table[index]
+    nodes = np.array(list(itertools.product(*AXES)))
+    np.testing.assert_array_equal(surface.lookup_batch(nodes), surface.table.reshape(-1))
+
+
+def test_multilinear_interpolation_reproduces_a_linear_function_and_clamps():
+    surface = _linear_surface()
+    points = np.random.default_rng(0).uniform([0.5, 0, 0.1, 0], [0.9, 180, 1.5, 5], (50, 4))
+    expected = points @ WEIGHTS + 1.0
+    np.testing.assert_allclose(surface.lookup_batch(points), expected, rtol=1e-12)
+    np.testing.assert_allclose([surface.lookup(p) for p in points], expected, rtol=1e-12)
+    assert surface.lookup([2.0, -10.0, 0.1, 0.0]) == pytest.approx(surface.lookup([0.9, 0.0, 0.1, 0.0]))
+
+
+def test_built_surface_is_independent_of_chunks_and_workers(tmp_path):
+    serial = build_yield_surface(tmp_path / 'serial.npy', points=(2, 3, 2, 2), replicates=2, chunk_size=5)
+    parallel = build_yield_surface(tmp_path / 'parallel.npy', points=(2, 3, 2, 2), replicates=2, chunk_size=7,
+                                   workers=2)
+    np.testing.assert_array_equal(np.asarray(serial.table), np.asarray(parallel.table))
+    assert serial.axes == [[0.5, 0.9], [0.0, 90.0, 180.0], [0.1, 1.5], [0.0, 5.0]]
+
+    with SurfaceEvaluator(serial) as evaluator:
+        node = (0.9, 90.0, 1.5, 5.0)
+        assert evaluator.evaluate([node])[node] == serial.table[1, 1, 1, 1]
+
+    with pytest.raises(ValueError):
+        YieldSurface.load(tmp_path / 'serial.npy', temperatures=[t + 1.0 for t in range(200)])
@@ -0,0 +1,50 @@
+import random
+
+import numpy as np
+
+from evaluation import FitnessEvaluator
+from fitness_cache import FitnessCache
+from ga import genetic_algorithm_optimized
+from population import N_LOCI, Plant_1, generate_configs_1
+from surrogate import RandomFeaturesRidge, SurrogateScreen, rank_correlation
+
+
+def test_random_features_ridge_fits_a_smooth_surface():
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 1, (400, 2))
+    y = np.sin(3 * X[:, 0]) + X[:, 1] ** 2
+    model = RandomFeaturesRidge([0, 0], [1, 1], seed=1)
+    model.update(X, y)
+    test = rng.uniform(0, 1, (100, 2))
+    assert rank_correlation(model.predict(test), np.sin(3 * test[:, 0]) + test[:, 1] ** 2) > 0.95
+
+
+def test_screen_simulates_everything_until_ready_then_top_fraction_and_exploration():
+    screen = SurrogateScreen(fraction=0.5, exploration=0.1, min_samples=20)
+    screen.bind([0, 0], [1, 1])
+    X = np.random.default_rng(0).uniform(0, 1, (20, 2))
+    chosen, predicted = screen.screen(X)
+    assert chosen.all() and predicted is None
+
+    screen.observe(X, X.sum(axis=1))
+    chosen, predicted = screen.screen(X)
+    assert chosen.sum() == 10 + 2
+    assert set(np.argsort(-predicted, kind='stable')[:10]) <= set(np.flatnonzero(chosen))
+
+
+def test_savings_count_simulations_of_screened_children_that_were_verified_later():
+    random.seed(0)
+    np.random.seed(0)
+    configs = generate_configs_1()
+    surrogate = SurrogateScreen(min_samples=20, seed=0)
+    stats = {}
+    with FitnessEvaluator(cache=FitnessCache(), store=False) as evaluator:
+        genetic_algorithm_optimized(configs, Plant_1, N_LOCI, evaluator, stats, population_size=20, iterations=12,
+                                    surrogate=surrogate)
+
+    assert stats['surrogate_verified'] > 0
+    assert surrogate.simulations == stats['evaluation_requests']
+    without_surrogate = stats['evaluation_requests'] - stats['surrogate_verified'] + stats['surrogate_screened_out']
+    assert without_surrogate == 20 + 12 * 18
+    assert stats['surrogate_savings'] == 1 - stats['evaluation_requests'] / without_surrogate
+    assert stats['surrogate_savings'] < stats['surrogate_screened_out'] / without_surrogate